@@ -0,0 +1,103 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from recipes.cache import (get_reference_cache_settings,
+                           get_response_cache_settings, ingredient_cache,
+                           recipe_response_cache, tag_cache)
+
+from .filters import IngredientSearchFilter
+from .mixins import cached_conditional_response, make_etag
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+sync_tag_list = TagViewSet.as_view({'get': 'list'})
+sync_ingredient_list = IngredientViewSet.as_view({'get': 'list'})
+sync_recipe_detail = RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
+
+
+def json_response(data):
+    return HttpResponse(
+        JSONRenderer().render(data), content_type='application/json'
+    )
+
+
+def conditional_json_response(request, data, etag):
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = json_response(data)
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def async_view(sync_view):
+    """Декоратор асинхронного view для ASGI режима.
+
+    GET запросы обрабатывает декорируемая корутина. Она возвращает ответ
+    или None, если ответить без синхронного кода не получилось. В этом
+    случае, как и для остальных методов, запрос обрабатывает sync_view
+    (view DRF) в потоке - так же, как Django обрабатывает синхронные view.
+    """
+    def decorator(handler):
+        async def view(request, *args, **kwargs):
+            if request.method == 'GET':
+                response = await handler(request, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        view.__name__ = handler.__name__
+        view.__doc__ = handler.__doc__
+        # csrf_exempt в Django 4.0 не поддерживает корутины.
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+@async_view(sync_tag_list)
+async def tag_list(request):
+    """Список тегов из кэша справочников."""
+    if not get_reference_cache_settings()['ENABLED']:
+        return None
+    return conditional_json_response(
+        request, await tag_cache.aall(),
+        make_etag(await tag_cache.aetag(), request.GET.urlencode())
+    )
+
+
+@async_view(sync_ingredient_list)
+async def ingredient_list(request):
+    """Список и поиск ингредиентов по названию из кэша справочников."""
+    if not get_reference_cache_settings()['ENABLED']:
+        return None
+    name = request.GET.get(IngredientSearchFilter.search_param, '').strip()
+    if name:
+        data = await ingredient_cache.asearch(
+            name, IngredientSearchFilter.max_results
+        )
+    else:
+        data = await ingredient_cache.aall()
+    return conditional_json_response(
+        request, data,
+        make_etag(await ingredient_cache.aetag(), request.GET.urlencode())
+    )
+
+
+@async_view(sync_recipe_detail)
+async def recipe_detail(request, pk):
+    """Рецепт для гостя из кэша ответов. Запросы пользователей и промахи
+    кэша обрабатывает RecipeViewSet, он же сохраняет ответ в кэш.
+    """
+    if ('HTTP_AUTHORIZATION' in request.META
+            or not get_response_cache_settings()['ENABLED']):
+        return None
+    cached = await recipe_response_cache.aget(request.build_absolute_uri())
+    if cached is None:
+        return None
+    return cached_conditional_response(request, cached, json_response)
@@ -0,0 +1,85 @@
+import base64
+import binascii
+import re
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from recipes.images import get_variant_urls
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField, который декодирует картинку частями во временный
+    файл на диске.
+
+    В памяти не держится декодированная копия картинки, а Pillow проверяет
+    файл по пути, не читая его целиком. При сохранении модели временный файл
+    перемещается в хранилище без копирования. Символы не из алфавита
+    base64 (например, переносы строк) отбрасываются, как и в
+    base64.b64decode, а неполная группа из 4 символов переносится в
+    следующую часть.
+    """
+    CHUNK_SIZE = 64 * 1024
+    NOT_BASE64_RE = re.compile(r'[^A-Za-z0-9+/=]')
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        header, separator, body = base64_data.partition(';base64,')
+        if not separator:
+            body = header
+        file = TemporaryUploadedFile(
+            self.get_file_name(None), 'application/octet-stream', 0, None
+        )
+        try:
+            rest = ''
+            for start in range(0, len(body), self.CHUNK_SIZE):
+                chunk = rest + self.NOT_BASE64_RE.sub(
+                    '', body[start:start + self.CHUNK_SIZE]
+                )
+                end = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:end]))
+                rest = chunk[end:]
+            file.write(base64.b64decode(rest))
+            file.size = file.tell()
+            file.seek(0)
+            file.name += '.' + self._get_extension(file)
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        return serializers.ImageField.to_internal_value(self, file)
+
+    def _get_extension(self, file):
+        try:
+            with Image.open(file.temporary_file_path()) as image:
+                extension = image.format.lower()
+        except (OSError, UnidentifiedImageError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = 'jpg' if extension == 'jpeg' else extension
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        return extension
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта
+    (см. recipes.images).
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        return {
+            name: request.build_absolute_uri(url) if request and url else url
+            for name, url in get_variant_urls(recipe).items()
+        }
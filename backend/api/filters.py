@@ -1,18 +1,35 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Case, Value, When
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
 from recipes.models import Recipe, Tag
 
 User = get_user_model()
 
 
-class CustomSearchFilter(SearchFilter):
-    """Кастомный класс поиска.
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по названию для автодополнения.
 
-    Переопределил параметр запроса.
+    Сначала возвращаются ингредиенты, название которых начинается с
+    поискового запроса, затем - содержащие его. Выдача ограничена
+    max_results элементами. На PostgreSQL поиск использует триграммный
+    индекс по выражению UPPER(name), в которое компилируются icontains и
+    istartswith.
     """
     search_param = 'name'
+    max_results = 50
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or view.action != 'list':
+            return queryset
+        return queryset.filter(name__icontains=name).annotate(
+            name_rank=Case(
+                When(name__istartswith=name, then=Value(0)),
+                default=Value(1),
+            )
+        ).order_by('name_rank', 'name')[:self.max_results]
 
 
 class RecipeFilter(filters.FilterSet):
@@ -23,22 +40,42 @@ class RecipeFilter(filters.FilterSet):
         tags - выбор рецептов только с определенным тегом
         is_favorited - выбор рецептов только из раздела Избранное
         is_in_shopping_cart - выбор рецептов только из раздела Список покупок
+    Сортировка:
+        ordering=popular - сначала самые популярные рецепты
     """
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
     )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'по популярности'),),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags')
 
+    def filter_tags(self, queryset, name, value):
+        """Фильтр по тегам: рецепты, у которых есть хотя бы один из тегов.
+
+        Вместо JOIN с таблицей тегов использует подзапрос id__in по
+        промежуточной таблице, поэтому рецепты не дублируются и DISTINCT
+        не нужен.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag_id__in=[tag.id for tag in value]
+        ).values('recipe_id'))
+
     def filter_is_favorited(self, queryset, name, value):
         """Фильтр по полю is_favorited (в избранном у текущего пользователя).
 
@@ -63,3 +100,11 @@ class RecipeFilter(filters.FilterSet):
         if value and not self.request.user.is_anonymous:
             return queryset.filter(shopping_carts__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка рецептов. popular - по убыванию рейтинга
+        популярности (см. recipes.popularity).
+        """
+        if value == 'popular':
+            return queryset.order_by('-popularity', 'id')
+        return queryset
@@ -0,0 +1,212 @@
+import hashlib
+from calendar import timegm
+from contextlib import ExitStack
+
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from recipes.cache import (get_reference_cache_settings,
+                           get_response_cache_settings)
+from .pagination import CustomCursorPagination
+from .replicas import mark_write, read_from_primary, read_from_replica
+
+
+def make_etag(*parts):
+    """Возвращает слабый ETag, построенный из переданных значений."""
+    digest = hashlib.md5(
+        '|'.join(str(part) for part in parts).encode(),
+        usedforsecurity=False
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def cached_conditional_response(request, cached, make_response):
+    """Возвращает ответ, сохраненный AnonymousResponseCacheMixin: 304, если
+    у клиента актуальная версия, иначе make_response(данные) с сохраненными
+    заголовками.
+    """
+    headers = cached['headers']
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified', ''))
+    )
+    if response is None:
+        response = make_response(cached['data'])
+    for header, value in headers.items():
+        response[header] = value
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class ConditionalGetMixin:
+    """Поддержка условных GET запросов (If-None-Match, If-Modified-Since).
+
+    Если ресурс у клиента не изменился, возвращает 304 без сериализации
+    данных.
+    """
+
+    def conditional_response(self, request, get_data, etag=None,
+                             last_modified=None):
+        """Возвращает 304, если ETag или дата изменения совпали с
+        переданными клиентом, иначе Response с данными из get_data().
+
+        Params:
+            get_data: функция, возвращающая данные ответа. Вызывается
+            только если ответ действительно нужен.
+            etag: ETag ресурса.
+            last_modified: datetime последнего изменения ресурса.
+        """
+        timestamp = last_modified and timegm(last_modified.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = Response(get_data())
+        if etag:
+            response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class ReferenceCacheMixin(ConditionalGetMixin):
+    """Отдает список и отдельные объекты справочника из кэша
+    reference_cache, не обращаясь к базе данных. Если кэш справочников
+    выключен в настройках, работает как обычный ReadOnlyModelViewSet.
+    """
+    reference_cache = None
+
+    def get_cached_list(self, request):
+        return self.reference_cache.all()
+
+    def list(self, request, *args, **kwargs):
+        if not get_reference_cache_settings()['ENABLED']:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request,
+            lambda: self.get_cached_list(request),
+            etag=make_etag(
+                self.reference_cache.etag, request.query_params.urlencode()
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not get_reference_cache_settings()['ENABLED']:
+            return super().retrieve(request, *args, **kwargs)
+        obj = self.reference_cache.get(kwargs[self.lookup_field])
+        if obj is None:
+            raise Http404
+        return self.conditional_response(
+            request, lambda: obj,
+            etag=make_etag(self.reference_cache.etag, obj['id']),
+        )
+
+
+class CursorPaginationMixin:
+    """Позволяет клиенту выбрать пагинацию по курсору параметром
+    ?pagination=cursor. Ссылки next/previous в ответе уже содержат курсор.
+    Без параметра используется обычный pagination_class.
+    """
+    cursor_pagination_class = CustomCursorPagination
+
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return bool(
+            params.get('pagination') == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует ответы list и retrieve для гостей.
+
+    Ответ для гостя не зависит от пользователя, поэтому он хранится в
+    response_cache по полному адресу запроса вместе с ETag и Last-Modified,
+    и повторный запрос не обращается к базе данных. Ответы пользователям
+    не кэшируются.
+    """
+    response_cache = None
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def use_response_cache(self, request):
+        return bool(
+            request.user.is_anonymous
+            and get_response_cache_settings()['ENABLED']
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        """Возвращает ответ из кэша или вызывает handler и кэширует
+        успешный ответ.
+        """
+        if not self.use_response_cache(request):
+            return handler(request, *args, **kwargs)
+        key = request.build_absolute_uri()
+        cached = self.response_cache.get(key)
+        if cached is None:
+            # Кэш общий для всех гостей, поэтому он заполняется из основной
+            # базы: ответ из отстающей реплики отдавался бы до конца TIMEOUT
+            # и после того, как реплика догонит основную базу.
+            with read_from_primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = {
+                'data': response.data,
+                'headers': {
+                    header: response[header]
+                    for header in self.cached_headers
+                    if response.has_header(header)
+                },
+            }
+            self.response_cache.set(key, cached)
+            return response
+        return cached_conditional_response(request, cached, Response)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class ReplicaReadMixin:
+    """Отправляет чтения безопасных запросов (GET, HEAD, OPTIONS) в
+    реплику базы данных.
+
+    Пользователь определяется по основной базе, чтобы только что
+    выданный токен был виден. После успешного изменяющего запроса чтения
+    пользователя некоторое время идут в основную базу, чтобы он увидел
+    свои изменения (см. api/replicas.py).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self.replica_stack:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self.replica_stack.enter_context(read_from_replica(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in SAFE_METHODS
+                and not status.is_client_error(response.status_code)
+                and not status.is_server_error(response.status_code)):
+            mark_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
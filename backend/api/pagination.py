@@ -1,4 +1,92 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def get_pagination_count_settings():
+    """Возвращает настройки подсчета количества объектов в пагинации с
+    подставленными значениями по умолчанию.
+
+    Settings:
+        CACHE_ALIAS - алиас кэша Django для посчитанных количеств.
+        TIMEOUT - сколько секунд хранить посчитанное количество.
+        ESTIMATE_THRESHOLD - начиная с какого размера таблицы количество
+        для запроса без фильтров берется из статистики PostgreSQL.
+    """
+    return {
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 30,
+        'ESTIMATE_THRESHOLD': 100000,
+        **getattr(settings, 'PAGINATION_COUNT', {}),
+    }
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Количество объектов кэшируется на TIMEOUT секунд по тексту SQL запроса,
+    то есть отдельно для каждого набора фильтров. Для запроса без фильтров
+    к большой таблице на PostgreSQL берется оценка из pg_class.reltuples.
+    Атрибут count_is_exact показывает, посчитано ли количество только что.
+    Кэш общий для всех процессов, поэтому количество считается по основной
+    базе, а не по реплике, которая может отставать.
+    """
+    count_is_exact = True
+
+    @staticmethod
+    def _estimate_count(queryset):
+        """Возвращает оценку количества строк в таблице или None, если
+        оценка недоступна или таблица меньше ESTIMATE_THRESHOLD.
+        """
+        connection = connections[queryset.db]
+        if (connection.vendor != 'postgresql' or queryset.query.where
+                or queryset.query.distinct):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                (queryset.model._meta.db_table,)
+            )
+            row = cursor.fetchone()
+        threshold = get_pagination_count_settings()['ESTIMATE_THRESHOLD']
+        if row is None or row[0] < threshold:
+            return None
+        return int(row[0])
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count_settings = get_pagination_count_settings()
+        cache = caches[count_settings['CACHE_ALIAS']]
+        queryset = self.object_list.using(DEFAULT_DB_ALIAS)
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        key = 'pagination:count:' + hashlib.md5(
+            sql.encode(), usedforsecurity=False
+        ).hexdigest()
+        count = cache.get(key)
+        if count is not None:
+            self.count_is_exact = False
+            return count
+        count = self._estimate_count(queryset)
+        if count is not None:
+            self.count_is_exact = False
+        else:
+            count = queryset.count()
+        cache.set(key, count, count_settings['TIMEOUT'])
+        return count
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -6,6 +94,39 @@ class CustomPageNumberPagination(PageNumberPagination):
 
     Переопределил количество элементов на странице.
     Переопределил параметр запроса.
+    Количество объектов кэшируется (CachedCountPaginator), поле
+    count_is_exact в ответе показывает, точное ли оно.
     """
     page_size = 2
     page_size_query_param = 'limit'
+    django_paginator_class = CachedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_is_exact', self.page.paginator.count_is_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CustomCursorPagination(CursorPagination):
+    """Пагинатор по курсору.
+
+    Не считает общее количество объектов и выбирает страницу по условию
+    id > курсора, поэтому любая страница стоит столько же, сколько первая.
+    Курсор строится только по id: запрос с другой сортировкой (например,
+    ordering=popular) отклоняется, а не отдается молча в порядке id.
+    """
+    page_size = 2
+    page_size_query_param = 'limit'
+    ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if queryset.query.order_by:
+            raise ValidationError({
+                'pagination': 'Пагинация по курсору не поддерживает '
+                              'выбранную сортировку'
+            })
+        return super().paginate_queryset(queryset, request, view)
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+_current_profile = ContextVar('current_profile', default=None)
+
+
+def get_profiling_settings():
+    """Возвращает настройки профилирования запросов с подставленными
+    значениями по умолчанию.
+
+    Settings:
+        ENABLED - профилировать запросы к API.
+        QUERY_BUDGETS - {'ViewSet.action': максимальное количество SQL
+        запросов}.
+        RAISE_ON_BUDGET - бросать QueryBudgetExceeded при превышении
+        бюджета (для тестов), иначе только писать предупреждение в лог.
+    """
+    return {
+        'ENABLED': settings.DEBUG,
+        'QUERY_BUDGETS': {},
+        'RAISE_ON_BUDGET': False,
+        **getattr(settings, 'PROFILING', {}),
+    }
+
+
+class QueryBudgetExceeded(Exception):
+    """Эндпоинт выполнил больше SQL запросов, чем разрешено бюджетом."""
+
+
+class RequestProfile:
+    """Замеры одного запроса: количество и время SQL запросов, время
+    сериализации и рендеринга ответа и общее время.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self._render_started = None
+        self._serialize_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        """execute_wrapper, считающий запросы и их время."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def serialize(self, to_representation, instance):
+        """Вызывает to_representation(instance) и учитывает его время.
+        Вложенные сериализаторы не учитываются повторно.
+        """
+        if self._serialize_depth:
+            return to_representation(instance)
+        self._serialize_depth += 1
+        started = time.perf_counter()
+        try:
+            return to_representation(instance)
+        finally:
+            self.serialize_time += time.perf_counter() - started
+            self._serialize_depth -= 1
+
+    def start_render(self):
+        self._render_started = time.perf_counter()
+
+    def finish_render(self, response):
+        self.render_time = time.perf_counter() - self._render_started
+
+    def server_timing(self):
+        """Возвращает значение заголовка Server-Timing."""
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+
+class EndpointStats:
+    """Накопленная статистика запросов по эндпоинтам в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, endpoint, profile):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_time': 0.0,
+                'serialize_time': 0.0,
+                'render_time': 0.0,
+                'total_time': 0.0,
+                'max_total_time': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += profile.queries
+            stats['max_queries'] = max(stats['max_queries'], profile.queries)
+            stats['db_time'] += profile.db_time
+            stats['serialize_time'] += profile.serialize_time
+            stats['render_time'] += profile.render_time
+            stats['total_time'] += profile.total_time
+            stats['max_total_time'] = max(
+                stats['max_total_time'], profile.total_time
+            )
+
+    def snapshot(self):
+        """Возвращает статистику, отсортированную по суммарному времени.
+        Время - в миллисекундах.
+        """
+        budgets = get_profiling_settings()['QUERY_BUDGETS']
+        with self._lock:
+            items = [(endpoint, dict(stats))
+                     for endpoint, stats in self._stats.items()]
+        items.sort(key=lambda item: item[1]['total_time'], reverse=True)
+        return [
+            {
+                'endpoint': endpoint,
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                'max_queries': stats['max_queries'],
+                'query_budget': budgets.get(endpoint),
+                'avg_db_ms': round(
+                    stats['db_time'] * 1000 / stats['requests'], 2
+                ),
+                'avg_serialize_ms': round(
+                    stats['serialize_time'] * 1000 / stats['requests'], 2
+                ),
+                'avg_render_ms': round(
+                    stats['render_time'] * 1000 / stats['requests'], 2
+                ),
+                'avg_total_ms': round(
+                    stats['total_time'] * 1000 / stats['requests'], 2
+                ),
+                'max_total_ms': round(stats['max_total_time'] * 1000, 2),
+            }
+            for endpoint, stats in items
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+endpoint_stats = EndpointStats()
+
+
+def get_endpoint(request):
+    """Возвращает имя эндпоинта вида 'RecipeViewSet.list' или None, если
+    запрос не попал во view.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class ProfiledSerializerMixin:
+    """Учитывает время to_representation сериализатора в профиле текущего
+    запроса (включая SQL запросы, выполненные во время сериализации).
+    """
+
+    def to_representation(self, instance):
+        profile = _current_profile.get()
+        if profile is None:
+            return super().to_representation(instance)
+        return profile.serialize(super().to_representation, instance)
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """Считает SQL запросы и время обработки каждого запроса к view.
+
+    Замеры отдаются в заголовке Server-Timing и накапливаются в
+    endpoint_stats (эндпоинт api/profiling/stats/). Если эндпоинт превысил
+    бюджет SQL запросов из QUERY_BUDGETS, пишет предупреждение или бросает
+    QueryBudgetExceeded. Запросы, которые выполняются при отдаче потокового
+    ответа, не учитываются. В ASGI режиме SQL запросы выполняются в
+    других потоках, поэтому там middleware запросы не профилирует.
+    """
+
+    def __call__(self, request):
+        profiling_settings = get_profiling_settings()
+        if (asyncio.iscoroutinefunction(self.get_response)
+                or not profiling_settings['ENABLED']):
+            return super().__call__(request)
+        profile = request.profile = RequestProfile()
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(
+                        profile.record_query
+                    ))
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        profile.total_time = time.perf_counter() - started
+        endpoint = get_endpoint(request)
+        if endpoint is None:
+            return response
+        endpoint_stats.add(endpoint, profile)
+        response['Server-Timing'] = profile.server_timing()
+        self.check_budget(endpoint, profile, profiling_settings)
+        return response
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is not None:
+            profile.start_render()
+            response.add_post_render_callback(profile.finish_render)
+        return response
+
+    def check_budget(self, endpoint, profile, profiling_settings):
+        budget = profiling_settings['QUERY_BUDGETS'].get(endpoint)
+        if budget is None or profile.queries <= budget:
+            return
+        message = (f'{endpoint} made {profile.queries} SQL queries, '
+                   f'budget is {budget}')
+        if profiling_settings['RAISE_ON_BUDGET']:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,104 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+_read_database = ContextVar('read_database', default=None)
+
+
+def get_replica_settings():
+    """Возвращает настройки чтения из реплик с подставленными значениями
+    по умолчанию.
+
+    Settings:
+        ALIASES - алиасы реплик из DATABASES.
+        STICKY_SECONDS - сколько секунд после записи пользователя его
+        чтения идут в основную базу, пока реплики догоняют ее.
+        CACHE_ALIAS - кэш с отметками о записях пользователей. Должен быть
+        общим для всех процессов.
+    """
+    return {
+        'ALIASES': [],
+        'STICKY_SECONDS': 5,
+        'CACHE_ALIAS': 'default',
+        **getattr(settings, 'DATABASE_REPLICAS', {}),
+    }
+
+
+def _sticky_key(user_id):
+    return f'replicas:sticky:{user_id}'
+
+
+def mark_write(user):
+    """Отмечает запись пользователя: следующие STICKY_SECONDS секунд его
+    чтения идут в основную базу.
+    """
+    replica_settings = get_replica_settings()
+    if replica_settings['ALIASES'] and user.is_authenticated:
+        caches[replica_settings['CACHE_ALIAS']].set(
+            _sticky_key(user.id), True, replica_settings['STICKY_SECONDS']
+        )
+
+
+def choose_replica(user):
+    """Возвращает алиас реплики для чтений пользователя или None, если
+    реплик нет или пользователь недавно записывал данные.
+    """
+    replica_settings = get_replica_settings()
+    if not replica_settings['ALIASES']:
+        return None
+    if user.is_authenticated and caches[replica_settings['CACHE_ALIAS']].get(
+        _sticky_key(user.id)
+    ):
+        return None
+    return random.choice(replica_settings['ALIASES'])
+
+
+@contextmanager
+def read_from_replica(user):
+    """Отправляет чтения внутри блока в реплику, выбранную для
+    пользователя.
+    """
+    token = _read_database.set(choose_replica(user))
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """Отправляет чтения внутри блока в основную базу, например, чтобы
+    заполнить общий кэш данными, которых реплика может еще не видеть.
+    """
+    token = _read_database.set(None)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+class ReplicaRouter:
+    """Роутер баз данных: чтения внутри read_from_replica() идут в
+    реплику, все остальные запросы - в основную базу.
+
+    Реплики - копии основной базы, поэтому связи между объектами из
+    разных баз разрешены, а миграции применяются только к основной базе.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replica_settings()['ALIASES']:
+            return False
+        return None
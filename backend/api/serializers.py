@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from djoser import serializers as djoser_serializers
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes.cache import favorite_ids_cache, shopping_cart_ids_cache
 from recipes.models import AmountIngredientForRecipe, Ingredient, Recipe, Tag
 
+from .fields import ImageVariantsField, StreamingBase64ImageField
+from .profiling import ProfiledSerializerMixin
+
 User = get_user_model()
 
 
@@ -19,7 +22,8 @@ class UserCreateSerializer(djoser_serializers.UserCreateSerializer):
                   'last_name')
 
 
-class UserSerializer(djoser_serializers.UserSerializer):
+class UserSerializer(ProfiledSerializerMixin,
+                     djoser_serializers.UserSerializer):
     """Сериализатор для работы с пользователями. Модель User.
     """
     is_subscribed = serializers.SerializerMethodField()
@@ -38,13 +42,15 @@ class UserSerializer(djoser_serializers.UserSerializer):
             True: Подписан.
             False: Не подписан.
         """
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous or (user == obj):
             return False
         return user.subscribe.filter(id=obj.id).exists()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для работы с тегами. Модель Tag.
     """
     class Meta:
@@ -52,7 +58,8 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(ProfiledSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для работы с ингоедиентами. Модель Ingredient.
     """
     class Meta:
@@ -75,7 +82,8 @@ class AmountIngredientForRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class ListRetrieveRecipeSerializer(serializers.ModelSerializer):
+class ListRetrieveRecipeSerializer(ProfiledSerializerMixin,
+                                   serializers.ModelSerializer):
     """Сериализатор для отображения списка рецептов, и конкретного рецепта.
     Модель Recipe.
     """
@@ -86,12 +94,14 @@ class ListRetrieveRecipeSerializer(serializers.ModelSerializer):
     ingredients = AmountIngredientForRecipeSerializer(
         source='amountingredientforrecipes', many=True
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time'
         )
 
     def get_is_favorited(self, obj):
@@ -102,9 +112,7 @@ class ListRetrieveRecipeSerializer(serializers.ModelSerializer):
             False: Рецепта нет в избранном.
         """
         user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(recipe_id=obj.id).exists()
+        return obj.id in favorite_ids_cache.get(user)
 
     def get_is_in_shopping_cart(self, obj):
         """Возвращает добавлен ли рецепт в список покупок.
@@ -114,9 +122,7 @@ class ListRetrieveRecipeSerializer(serializers.ModelSerializer):
             False: Рецепта нет в списке покупок.
         """
         user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.shopping_carts.filter(recipe_id=obj.id).exists()
+        return obj.id in shopping_cart_ids_cache.get(user)
 
 
 class AmountWriteSerializer(serializers.Serializer):
@@ -132,8 +138,8 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
     """
     author = UserSerializer(read_only=True)
     ingredients = AmountWriteSerializer(many=True)
-    tags = serializers.ListField()
-    image = Base64ImageField()
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = StreamingBase64ImageField()
     name = serializers.CharField(max_length=200)
     text = serializers.CharField()
     cooking_time = serializers.IntegerField()
@@ -143,11 +149,42 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time')
 
+    def save(self, **kwargs):
+        """Сохраняет рецепт и закрывает временный файл загруженной
+        картинки.
+        """
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
+        user = self.context['request'].user
+        instance = Recipe.objects.for_api(user).get(pk=instance.pk)
         return ListRetrieveRecipeSerializer(
             instance, context=self.context
         ).data
 
+    @staticmethod
+    def get_missing_ids(model, ids):
+        """Возвращает отсортированный список id, которых нет в таблице model.
+        Проверка выполняется одним запросом.
+        """
+        existing = model.objects.filter(id__in=ids).values_list(
+            'id', flat=True
+        )
+        return sorted(set(ids) - set(existing))
+
+    def validate_tags(self, tags):
+        missing_tags = self.get_missing_ids(Tag, tags)
+        if missing_tags:
+            raise serializers.ValidationError([
+                f'Тега с id {id} не существует' for id in missing_tags
+            ])
+        return tags
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         if not ingredients:
@@ -158,15 +195,12 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
         min_amount_ingredient = 1
         max_amount_ingredient = 1000
 
-        unique_ingredients = []
-        for ingredients_item in ingredients:
-            ingredient = get_object_or_404(Ingredient,
-                                           id=(ingredients_item['id']))
-            if ingredient in unique_ingredients:
-                raise serializers.ValidationError('Ингредиенты должны '
-                                                  'быть уникальными')
-            unique_ingredients.append(ingredient)
+        ingredient_ids = {item['id'] for item in ingredients}
+        if len(ingredient_ids) != len(ingredients):
+            raise serializers.ValidationError('Ингредиенты должны '
+                                              'быть уникальными')
 
+        for ingredients_item in ingredients:
             if int(ingredients_item['amount']) < min_amount_ingredient:
                 raise serializers.ValidationError({
                     'ingredients': ('Минимальное количество ингредиента '
@@ -178,6 +212,15 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
                                     f'{max_amount_ingredient}')
                 })
 
+        missing_ingredients = self.get_missing_ids(Ingredient, ingredient_ids)
+        if missing_ingredients:
+            raise serializers.ValidationError({
+                'ingredients': [
+                    f'Ингредиента с id {id} не существует'
+                    for id in missing_ingredients
+                ]
+            })
+
         cooking_time = data.get('cooking_time')
         if not cooking_time:
             raise serializers.ValidationError({
@@ -201,15 +244,53 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
 
     def create_amount_ingredient_for_recipe(self, recipe, ingredients):
         """Записывает ингредиенты вложенные в рецепт.
-        Создает объект AmountIngredientForRecipe.
+        Создает объекты AmountIngredientForRecipe одним запросом.
         """
-        for ingredient in ingredients:
-            AmountIngredientForRecipe.objects.create(
+        AmountIngredientForRecipe.objects.bulk_create(
+            AmountIngredientForRecipe(
                 recipe=recipe,
                 ingredient_id=ingredient['id'],
                 amount=ingredient['amount'],
             )
+            for ingredient in ingredients
+        )
 
+    def update_amount_ingredient_for_recipe(self, recipe, ingredients):
+        """Обновляет ингредиенты вложенные в рецепт.
+        Удаляет, изменяет и создает только те объекты
+        AmountIngredientForRecipe, которые отличаются от новых данных.
+        """
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            item.ingredient_id: item
+            for item in recipe.amountingredientforrecipes.all()
+        }
+
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            recipe.amountingredientforrecipes.filter(
+                ingredient_id__in=removed
+            ).delete()
+
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            AmountIngredientForRecipe.objects.bulk_update(changed, ('amount',))
+
+        self.create_amount_ingredient_for_recipe(recipe, (
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        ))
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создает рецепт.
         """
@@ -222,6 +303,7 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
         self.create_amount_ingredient_for_recipe(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         """Обновляет рецепт.
         """
@@ -229,23 +311,23 @@ class CreateUpdateDestroyRecipeSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
 
         if tags:
-            recipe.tags.clear()
             recipe.tags.set(tags)
 
         if ingredients_data:
-            recipe.amountingredientforrecipes.all().delete()
-            self.create_amount_ingredient_for_recipe(recipe, ingredients_data)
+            self.update_amount_ingredient_for_recipe(recipe, ingredients_data)
 
-        recipe.save()
         return super().update(recipe, validated_data)
 
 
-class SimpleRecipeSerializer(serializers.ModelSerializer):
+class SimpleRecipeSerializer(ProfiledSerializerMixin,
+                             serializers.ModelSerializer):
     """Упрощенный сериализатор вывода рецептов в подписках.
     """
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
@@ -253,10 +335,7 @@ class SubscriptionSerializer(UserSerializer):
     """Сериализатор для работы с подписками.
     """
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -270,12 +349,16 @@ class SubscriptionSerializer(UserSerializer):
         """Возвращет рецепты авторов при запросе авторов, на которых подписан
         текущий пользователь.
 
-        Params:
-            recipes_limit: сколько рецептов выодить у автора.
+        Context:
+            recipes_limit: сколько рецептов выводить у автора (уже
+            проверенное view число или None).
         """
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
+        if hasattr(obj, 'limited_recipes'):
+            return SimpleRecipeSerializer(
+                obj.limited_recipes, many=True
+            ).data
         queryset = obj.recipes.all()
-        if limit:
-            queryset = queryset[:int(limit)]
+        limit = self.context.get('recipes_limit')
+        if limit is not None:
+            queryset = queryset[:limit]
         return SimpleRecipeSerializer(queryset, many=True).data
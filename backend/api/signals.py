@@ -0,0 +1,22 @@
+import django
+from django.core.signals import request_started
+from django.db import connections
+
+
+def check_connections_health(**kwargs):
+    """Закрывает постоянные соединения с базой данных, которые перестали
+    работать (например, после перезапуска PostgreSQL или пулера), чтобы
+    запрос открыл новое соединение, а не упал на первом SQL запросе.
+
+    Аналог настройки CONN_HEALTH_CHECKS из Django 4.1, но соединение
+    проверяется в начале запроса, а не при первом обращении к базе.
+    """
+    for connection in connections.all():
+        if (connection.connection is not None
+                and connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not connection.is_usable()):
+            connection.close()
+
+
+if django.VERSION < (4, 1):
+    request_started.connect(check_connections_health)
@@ -0,0 +1,847 @@
+import base64
+import os
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.cache import favorite_ids_cache, ingredient_cache, tag_cache
+from recipes.models import (AmountIngredientForRecipe, Favorite, Ingredient,
+                            PopularityEpoch, Recipe, ShoppingCart, Tag)
+
+from . import async_views
+from . import urls as api_urls
+from .fields import StreamingBase64ImageField
+from .profiling import QueryBudgetExceeded
+from .replicas import get_replica_settings, read_from_replica
+from .serializers import CreateUpdateDestroyRecipeSerializer
+
+User = get_user_model()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name=username, last_name=username, password='password'
+    )
+
+
+def create_recipes(author, count, ingredients, tags=()):
+    """Создает count рецептов автора с переданными ингредиентами и тегами.
+    Рецепты создаются без картинки, чтобы не строить ее копии.
+    """
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Описание',
+            cooking_time=10, image=''
+        )
+        AmountIngredientForRecipe.objects.bulk_create(
+            AmountIngredientForRecipe(
+                recipe=recipe, ingredient=ingredient, amount=number + 1
+            )
+            for ingredient in ingredients
+        )
+        recipe.tags.set(tags)
+        recipes.append(recipe)
+    author.refresh_from_db(fields=('recipes_count',))
+    return recipes
+
+
+class APITestMixin:
+    """Сбрасывает кэши между тестами и дает клиента с токеном
+    пользователя.
+    """
+
+    def setUp(self):
+        self.clear_caches()
+        self.anonymous_client = APIClient()
+
+    def clear_caches(self):
+        for cache in caches.all():
+            cache.clear()
+        tag_cache.invalidate()
+        ingredient_cache.invalidate()
+
+    def get_client(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+
+@override_settings(DATABASE_REPLICAS={'ALIASES': []})
+class APITestCase(APITestMixin, TestCase):
+    """Реплика не видит данных из транзакции TestCase, поэтому все чтения
+    идут в основную базу (чтения из реплики проверяет ReplicaTest).
+    """
+
+
+class DownloadShoppingCartTest(APITestCase):
+    """Список покупок собирается одним запросом при любом размере
+    корзины.
+    """
+    queries = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        for number in range(10):
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipes = create_recipes(cls.author, 20, cls.ingredients)
+
+    def download(self, user, cart_size):
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe)
+            for recipe in self.recipes[:cart_size]
+        )
+        client = self.get_client(user)
+        with self.assertNumQueries(self.queries):
+            response = client.get('/api/recipes/download_shopping_cart/')
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        return content.splitlines()
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        small = self.download(create_user('small'), 1)
+        large = self.download(create_user('large'), 20)
+        self.assertEqual(len(small), len(self.ingredients))
+        self.assertEqual(len(large), len(self.ingredients))
+        self.assertIn('Ингредиент 0 - 210, г', large)
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Количество запросов списка рецептов не зависит от размера
+    страницы.
+
+    Запросы: токен, количество рецептов (на PostgreSQL еще оценка по
+    статистике), страница рецептов, авторы, теги, ингредиенты, избранное
+    и список покупок пользователя.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        authors = [create_user(f'author{number}') for number in range(3)]
+        for number in range(3):
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+        tags = list(Tag.objects.all())
+        ingredients = list(Ingredient.objects.all())
+        for author in authors:
+            recipes = create_recipes(author, 4, ingredients, tags)
+            Favorite.objects.create(user=cls.user, recipe=recipes[0])
+            ShoppingCart.objects.create(user=cls.user, recipe=recipes[1])
+        cls.user.subscribe.add(authors[0])
+
+    def get_list(self, limit):
+        queries = 9 if connection.vendor == 'postgresql' else 8
+        client = self.get_client(self.user)
+        with self.assertNumQueries(queries):
+            response = client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEqual(len(self.get_list(2)), 2)
+        self.clear_caches()
+        results = self.get_list(12)
+        self.assertEqual(len(results), 12)
+        self.assertTrue(all(
+            len(recipe['tags']) == 3 and len(recipe['ingredients']) == 3
+            for recipe in results
+        ))
+        self.assertEqual(
+            sum(recipe['is_favorited'] for recipe in results), 3
+        )
+        self.assertEqual(
+            sum(recipe['author']['is_subscribed'] for recipe in results), 4
+        )
+
+
+class SubscriptionsQueriesTest(APITestCase):
+    """Количество запросов страницы подписок не зависит от количества
+    авторов и их рецептов.
+
+    Запросы: токен, количество подписок, страница авторов и их рецепты.
+    """
+    queries = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        for number in range(6):
+            author = create_user(f'author{number}')
+            create_recipes(author, 3, [ingredient])
+            cls.user.subscribe.add(author)
+
+    def get_subscriptions(self, limit):
+        client = self.get_client(self.user)
+        with self.assertNumQueries(self.queries):
+            response = client.get(
+                '/api/users/subscriptions/',
+                {'limit': limit, 'recipes_limit': 2}
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.assertEqual(len(self.get_subscriptions(1)), 1)
+        self.clear_caches()
+        results = self.get_subscriptions(6)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(
+            len(author['recipes']) == 2 and author['recipes_count'] == 3
+            and author['is_subscribed'] for author in results
+        ))
+
+    def test_invalid_recipes_limit(self):
+        client = self.get_client(create_user('nobody'))
+        for recipes_limit in ('abc', '-1'):
+            response = client.get(
+                '/api/users/subscriptions/', {'recipes_limit': recipes_limit}
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('recipes_limit', response.json())
+
+
+class UpdateRecipeIngredientsTest(APITestCase):
+    """Обновление ингредиентов рецепта трогает только изменившиеся строки
+    фиксированным количеством запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.recipe = create_recipes(
+            create_user('author'), 1, cls.ingredients[:3]
+        )[0]
+
+    def update(self, amounts, queries):
+        serializer = CreateUpdateDestroyRecipeSerializer()
+        with self.assertNumQueries(queries):
+            serializer.update_amount_ingredient_for_recipe(self.recipe, [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts
+            ])
+        return {
+            item.ingredient_id: item
+            for item in self.recipe.amountingredientforrecipes.all()
+        }
+
+    def test_only_changed_rows_are_written(self):
+        first, second, third, fourth = self.ingredients
+        before = {
+            item.ingredient_id: item
+            for item in self.recipe.amountingredientforrecipes.all()
+        }
+        # Чтение текущих строк, удаление (выборка и DELETE), bulk_update и
+        # bulk_create.
+        after = self.update(((second, 1), (third, 5), (fourth, 7)), 5)
+        self.assertEqual(set(after), {second.id, third.id, fourth.id})
+        self.assertEqual(after[second.id].id, before[second.id].id)
+        self.assertEqual(after[third.id].id, before[third.id].id)
+        self.assertEqual(
+            {id: item.amount for id, item in after.items()},
+            {second.id: 1, third.id: 5, fourth.id: 7}
+        )
+
+    def test_unchanged_ingredients_are_not_written(self):
+        first, second, third, _ = self.ingredients
+        self.update(((first, 1), (second, 1), (third, 1)), 1)
+
+
+class RecipeValidationTest(APITestCase):
+    """Несуществующие теги и ингредиенты перечисляются в ответе 400
+    целиком, а не по одному.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('author')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#000000', slug='breakfast'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+        cls.image = ('data:image/png;base64,'
+                     + base64.b64encode(buffer.getvalue()).decode())
+
+    def create_recipe(self, tags, ingredients):
+        response = self.get_client(self.user).post('/api/recipes/', {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': tags,
+            'ingredients': [{'id': id, 'amount': 1} for id in ingredients],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+        return response.json()
+
+    def test_all_missing_tags_are_listed(self):
+        missing = (self.tag.id + 2, self.tag.id + 1)
+        errors = self.create_recipe(
+            [self.tag.id, *missing], [self.ingredient.id]
+        )
+        self.assertEqual(errors['tags'], [
+            f'Тега с id {id} не существует' for id in sorted(missing)
+        ])
+
+    def test_all_missing_ingredients_are_listed(self):
+        missing = (self.ingredient.id + 2, self.ingredient.id + 1)
+        errors = self.create_recipe(
+            [self.tag.id], [self.ingredient.id, *missing]
+        )
+        self.assertEqual(errors['ingredients'], [
+            f'Ингредиента с id {id} не существует' for id in sorted(missing)
+        ])
+
+
+class CursorPaginationTest(APITestCase):
+    """Пагинация по курсору не считает количество объектов и проходит
+    все страницы по ссылкам next.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.authors = [create_user(f'author{number}') for number in range(5)]
+        cls.recipes = []
+        for author in cls.authors:
+            cls.recipes += create_recipes(author, 1, [ingredient])
+            cls.user.subscribe.add(author)
+
+    def walk(self, url):
+        """Возвращает id объектов со всех страниц."""
+        client = self.get_client(self.user)
+        ids = []
+        params = {'pagination': 'cursor', 'limit': 2}
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any(
+                'COUNT(' in query['sql'].upper()
+                for query in queries.captured_queries
+            ))
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids += [item['id'] for item in data['results']]
+            url, params = data['next'], {}
+        return ids
+
+    def test_recipes(self):
+        self.assertEqual(
+            self.walk('/api/recipes/'), [recipe.id for recipe in self.recipes]
+        )
+
+    def test_subscriptions(self):
+        self.assertEqual(
+            self.walk('/api/users/subscriptions/'),
+            [author.id for author in self.authors]
+        )
+
+
+class CachedCountTest(APITestCase):
+    """Количество рецептов в пагинации кэшируется отдельно для каждого
+    набора фильтров, count_is_exact показывает, что оно взято из кэша.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.author = create_user('author')
+        create_recipes(cls.author, 3, [ingredient])
+        create_recipes(create_user('other'), 2, [ingredient])
+
+    def get_count(self, params):
+        response = self.get_client(self.user).get(
+            '/api/recipes/', {'limit': 1, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['count'], data['count_is_exact']
+
+    def test_count_is_cached_per_filter(self):
+        by_author = {'author': self.author.id}
+        self.assertEqual(self.get_count({}), (5, True))
+        self.assertEqual(self.get_count(by_author), (3, True))
+        Recipe.objects.filter(author=self.author).first().delete()
+        self.assertEqual(self.get_count({}), (5, False))
+        self.assertEqual(self.get_count(by_author), (3, False))
+        self.assertEqual(self.get_count({'page': 2}), (5, False))
+        self.clear_caches()
+        self.assertEqual(self.get_count(by_author), (2, True))
+
+
+class TagFilterTest(APITestCase):
+    """Рецепт с несколькими выбранными тегами попадает в выдачу один
+    раз.
+    """
+
+    def test_no_duplicates(self):
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(3)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        author = create_user('author')
+        both = create_recipes(author, 2, [ingredient], tags[:2])
+        single = create_recipes(author, 1, [ingredient], tags[1:2])
+        create_recipes(author, 1, [ingredient], tags[2:])
+        response = self.anonymous_client.get(
+            '/api/recipes/', {'tags': ['tag0', 'tag1'], 'limit': 10}
+        )
+        data = response.json()
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            [recipe.id for recipe in both + single]
+        )
+        self.assertEqual(data['count'], 3)
+
+
+class AnonymousResponseCacheTest(APITestCase):
+    """Изменения рецептов и ингредиентов сбрасывают закэшированные
+    страницы для гостей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = create_recipes(
+            create_user('author'), 1, [cls.ingredient]
+        )[0]
+
+    def get_recipe(self):
+        response = self.anonymous_client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'][0]
+
+    def test_writes_invalidate_cached_pages(self):
+        self.get_recipe()
+        with self.assertNumQueries(0):
+            self.get_recipe()
+
+        self.recipe.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertEqual(self.get_recipe()['name'], 'Новое название')
+
+        self.ingredient.name = 'Морская соль'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.save()
+        self.assertEqual(
+            self.get_recipe()['ingredients'][0]['name'], 'Морская соль'
+        )
+
+
+class RecipeConditionalGetTest(APITestCase):
+    """Условный запрос рецепта не отдает 304 после изменения автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = create_recipes(cls.author, 1, [ingredient])[0]
+
+    def test_author_change_invalidates_cached_copy(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.anonymous_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(
+            self.anonymous_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            .status_code, 304
+        )
+        self.author.first_name = 'Новое имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        response = self.anonymous_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['author']['first_name'], 'Новое имя')
+
+
+class CountersTest(APITestCase):
+    """Счетчики учитывают объекты, созданные не через API (в админке или
+    через ORM), и удаление их через API не уводит счетчик ниже нуля.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipe = create_recipes(self.author, 1, [ingredient])[0]
+
+    def assertCounters(self, favorites, recipes, subscribers):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, favorites)
+        self.assertEqual(self.author.recipes_count, recipes)
+        self.assertEqual(self.author.subscribers_count, subscribers)
+
+    def test_admin_then_api(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.client.force_login(admin)
+        response = self.client.post('/admin/recipes/favorite/add/', {
+            'user': self.reader.id, 'recipe': self.recipe.id,
+            'created_0': '2024-01-01', 'created_1': '12:00:00',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.reader.subscribe.add(self.author)
+        self.assertCounters(favorites=1, recipes=1, subscribers=1)
+
+        client = self.get_client(self.reader)
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(client.delete(url).status_code, 204)
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertCounters(favorites=0, recipes=1, subscribers=0)
+
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(
+            self.get_client(self.author).delete(url).status_code, 204
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_subscribe_manager(self):
+        other = create_user('other')
+        self.reader.subscribe.add(self.author, other)
+        self.reader.subscribe.remove(self.author)
+        self.reader.subscribe.remove(self.author)
+        self.assertCounters(favorites=0, recipes=1, subscribers=0)
+        self.author.subscribers.set([self.reader, other])
+        self.assertCounters(favorites=0, recipes=1, subscribers=2)
+        self.reader.subscribe.clear()
+        self.assertCounters(favorites=0, recipes=1, subscribers=1)
+        other.refresh_from_db()
+        self.assertEqual(other.subscribers_count, 0)
+        self.author.subscribers.clear()
+        self.assertCounters(favorites=0, recipes=1, subscribers=0)
+
+    def test_cascade_delete(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        self.author.subscribe.add(self.reader)
+        self.author.delete()
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.subscribers_count, 0)
+
+
+class SubscribeTest(APITestCase):
+    """Повторная подписка не увеличивает счетчик подписчиков."""
+
+    def test_subscribe_twice(self):
+        author = create_user('author')
+        client = self.get_client(create_user('reader'))
+        url = f'/api/users/{author.id}/subscribe/'
+        self.assertEqual(client.post(url).status_code, 201)
+        self.assertEqual(client.post(url).status_code, 400)
+        author.refresh_from_db()
+        self.assertEqual(author.subscribers_count, 1)
+
+
+class PopularityTest(APITestCase):
+    """Рейтинг популярности не переполняется и сортировка по нему не
+    смешивается с пагинацией по курсору.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipes = create_recipes(cls.author, 3, [ingredient])
+
+    @override_settings(POPULARITY={
+        'HALF_LIFE_DAYS': 1,
+        'EPOCH': datetime(2000, 1, 1, tzinfo=timezone.utc),
+    })
+    def test_old_epoch_is_moved_instead_of_overflow(self):
+        readers = [create_user(f'reader{number}') for number in range(2)]
+        for reader, recipes in zip(readers, (self.recipes, self.recipes[1:])):
+            client = self.get_client(reader)
+            for recipe in recipes:
+                response = client.post(f'/api/recipes/{recipe.id}/favorite/')
+                self.assertEqual(response.status_code, 201)
+        self.assertEqual(PopularityEpoch.objects.count(), 1)
+        response = self.anonymous_client.get(
+            '/api/recipes/', {'ordering': 'popular', 'limit': 3}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.recipes[2].id, self.recipes[1].id, self.recipes[0].id]
+        )
+
+    def test_popular_ordering_with_cursor_is_rejected(self):
+        response = self.anonymous_client.get(
+            '/api/recipes/', {'ordering': 'popular', 'pagination': 'cursor'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewsURLConf:
+    """Адреса API в ASGI режиме (ASYNC_VIEWS, см. api/urls.py)."""
+    urlpatterns = [
+        path('api/tags/', async_views.tag_list),
+        path('api/ingredients/', async_views.ingredient_list),
+        path('api/recipes/<int:pk>/', async_views.recipe_detail),
+        path('api/', include(api_urls)),
+    ]
+
+
+@override_settings(ASYNC_VIEWS=True, ROOT_URLCONF=AsyncViewsURLConf)
+class AsyncViewsTest(APITestCase):
+    """Асинхронные view отвечают из кэшей, а теплый кэш справочников
+    читается без потока синхронных view.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#000000', slug='breakfast')
+        for name in ('Соль', 'Сахар', 'Перец'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        cls.recipe = create_recipes(
+            create_user('author'), 1, Ingredient.objects.all()
+        )[0]
+
+    async def test_reference_lists(self):
+        response = await self.async_client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [tag['slug'] for tag in response.json()], ['breakfast']
+        )
+        response = await self.async_client.get(
+            '/api/ingredients/', {'name': 'с'}
+        )
+        self.assertEqual(
+            [item['name'] for item in response.json()], ['Сахар', 'Соль']
+        )
+        etag = response['ETag']
+        with mock.patch(
+            'recipes.cache.sync_to_async', wraps=sync_to_async
+        ) as wrapped:
+            response = await self.async_client.get(
+                '/api/ingredients/', {'name': 'с'},
+                # AsyncClient в Django 4.0 передает заголовки как есть.
+                **{'If-None-Match': etag}
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(wrapped.call_args_list)
+        for call in wrapped.call_args_list:
+            self.assertEqual(call.kwargs, {'thread_sensitive': False})
+
+    async def test_anonymous_recipe_from_response_cache(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        first = await self.async_client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with mock.patch.object(
+            async_views, 'sync_recipe_detail', side_effect=AssertionError
+        ):
+            second = await self.async_client.get(url)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+
+class StreamingBase64ImageFieldTest(TestCase):
+    """Картинка больше одной части декодируется так же, как целиком, в
+    том числе с переносами строк.
+    """
+
+    def test_line_wrapped_image(self):
+        buffer = BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(
+            buffer, 'PNG'
+        )
+        png = buffer.getvalue()
+        self.assertGreater(
+            len(png), StreamingBase64ImageField.CHUNK_SIZE
+        )
+        for encode in (base64.b64encode, base64.encodebytes):
+            file = StreamingBase64ImageField().to_internal_value(
+                'data:image/png;base64,' + encode(png).decode()
+            )
+            with file:
+                self.assertEqual(file.read(), png)
+                self.assertTrue(file.name.endswith('.png'))
+
+
+@override_settings(PROFILING={
+    'ENABLED': True,
+    'QUERY_BUDGETS': {'TagViewSet.list': 0, 'RecipeViewSet.retrieve': 20},
+    'RAISE_ON_BUDGET': True,
+})
+class ProfilingTest(APITestCase):
+    """Превышение бюджета SQL запросов роняет тест, время сериализации
+    отдается в Server-Timing.
+    """
+
+    @override_settings(PROFILING={
+        **settings.PROFILING, 'ENABLED': True, 'RAISE_ON_BUDGET': True
+    })
+    def test_user_list_fits_budget_at_any_page_size(self):
+        reader = create_user('reader')
+        authors = [create_user(f'author{number}') for number in range(7)]
+        reader.subscribe.add(*authors[:3])
+        client = self.get_client(reader)
+        for limit in (2, 8):
+            response = client.get('/api/users/', {'limit': limit})
+            self.assertEqual(len(response.json()['results']), limit)
+        self.assertEqual(
+            sum(user['is_subscribed'] for user in response.json()['results']),
+            3
+        )
+
+    def test_budget_exceeded(self):
+        Tag.objects.create(name='Завтрак', color='#000000', slug='breakfast')
+        with self.assertRaises(QueryBudgetExceeded):
+            self.anonymous_client.get('/api/tags/')
+
+    def test_serialize_time_is_reported(self):
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        recipe = create_recipes(author, 1, [ingredient])[0]
+        response = self.anonymous_client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'serialize;dur=\d')
+
+
+@skipUnless(
+    get_replica_settings()['ALIASES'],
+    'Нужна реплика, например --settings=foodgram.test_settings'
+)
+class ReplicaTest(APITestMixin, TransactionTestCase):
+    """Чтения API идут в реплику, кроме чтений пользователя сразу после
+    его записи. Общие кэши заполняются из основной базы.
+
+    Реплика в тестах - зеркало основной базы, которое не участвует в
+    транзакции TestCase, поэтому тест использует TransactionTestCase.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.replica = get_replica_settings()['ALIASES'][0]
+        self.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipe = create_recipes(create_user('author'), 1, [ingredient])[0]
+
+    def capture_queries(self):
+        """Возвращает (запросы к основной базе, запросы к реплике)."""
+        return (
+            CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]),
+            CaptureQueriesContext(connections[self.replica]),
+        )
+
+    def test_reads_go_to_replica_until_write(self):
+        client = self.get_client(self.user)
+        primary, replica = self.capture_queries()
+        with primary, replica:
+            response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica.captured_queries)
+        # В основную базу идет только COUNT для общего кэша пагинации.
+        self.assertNotIn(
+            'recipes_recipe', ' '.join(
+                query['sql'] for query in primary.captured_queries
+                if not query['sql'].startswith('SELECT COUNT(')
+            )
+        )
+
+        response = client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        primary, replica = self.capture_queries()
+        with primary, replica:
+            response = client.get('/api/recipes/')
+        self.assertEqual(response.json()['results'][0]['is_favorited'], True)
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_cache_fills_use_primary(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        primary, replica = self.capture_queries()
+        with primary, replica, read_from_replica(AnonymousUser()):
+            self.assertEqual(
+                favorite_ids_cache.get(self.user), {self.recipe.id}
+            )
+            self.assertEqual(tag_cache.all(), [])
+        self.assertEqual(len(primary.captured_queries), 2)
+        self.assertEqual(replica.captured_queries, [])
+
+    def test_shared_response_and_count_caches_fill_from_primary(self):
+        primary, replica = self.capture_queries()
+        with primary, replica:
+            response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(primary.captured_queries)
+        self.assertEqual(replica.captured_queries, [])
+
+        primary, replica = self.capture_queries()
+        with primary, replica:
+            response = self.get_client(self.user).get('/api/recipes/')
+        self.assertEqual(response.json()['count'], 1)
+        self.assertTrue(replica.captured_queries)
+        self.assertIn('COUNT(', ' '.join(
+            query['sql'] for query in primary.captured_queries
+        ))
+        self.assertNotIn('COUNT(', ' '.join(
+            query['sql'] for query in replica.captured_queries
+        ))
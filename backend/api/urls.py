@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, ProfilingStatsView, RecipeViewSet,
+                    TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -15,4 +17,14 @@ router.register('recipes', RecipeViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('profiling/stats/', ProfilingStatsView.as_view()),
 ]
+
+if settings.ASYNC_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        path('tags/', async_views.tag_list),
+        path('ingredients/', async_views.ingredient_list),
+        path('recipes/<int:pk>/', async_views.recipe_detail),
+    ] + urlpatterns
@@ -1,16 +1,30 @@
 from django.contrib.auth import get_user_model
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery, Sum
+from django.http.response import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views as djoser_views
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from .filters import CustomSearchFilter, RecipeFilter
+from recipes.cache import (favorite_ids_cache, ingredient_cache,
+                           recipe_response_cache, shopping_cart_ids_cache,
+                           tag_cache)
+from recipes.counters import increment
+from recipes.models import (AmountIngredientForRecipe, Favorite, Ingredient,
+                            Recipe, ShoppingCart, Tag)
+
+from .filters import IngredientSearchFilter, RecipeFilter
+from .mixins import (AnonymousResponseCacheMixin, ConditionalGetMixin,
+                     CursorPaginationMixin, ReferenceCacheMixin,
+                     ReplicaReadMixin, make_etag)
 from .pagination import CustomPageNumberPagination
+from .profiling import endpoint_stats
 from .permissions import IsAuthorOrIsAdminOrReadOnly
 from .serializers import (CreateUpdateDestroyRecipeSerializer,
                           IngredientSerializer, ListRetrieveRecipeSerializer,
@@ -20,10 +34,29 @@ from .serializers import (CreateUpdateDestroyRecipeSerializer,
 User = get_user_model()
 
 
-class UserViewSet(djoser_views.UserViewSet):
+class UserViewSet(ReplicaReadMixin, CursorPaginationMixin,
+                  djoser_views.UserViewSet):
     queryset = User.objects.all()
     pagination_class = CustomPageNumberPagination
 
+    def get_queryset(self):
+        # is_subscribed считается в том же запросе, а не отдельным EXISTS
+        # для каждого пользователя на странице.
+        return super().get_queryset().with_is_subscribed(self.request.user)
+
+    def get_recipes_limit(self, request):
+        """Возвращает количество рецептов автора в ответе из параметра
+        recipes_limit или None, если параметр не передан.
+        """
+        recipes_limit = request.query_params.get('recipes_limit')
+        if not recipes_limit:
+            return None
+        if not recipes_limit.isdigit():
+            raise ValidationError({
+                'recipes_limit': 'Должно быть неотрицательным целым числом'
+            })
+        return int(recipes_limit)
+
     @action(detail=True, methods=('post',), url_path='subscribe',
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, id=None):
@@ -35,15 +68,22 @@ class UserViewSet(djoser_views.UserViewSet):
                 {'errors': 'Вы не можете подписываться на самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if user.subscribe.filter(id=author.id).exists():
+        with transaction.atomic():
+            _, created = User.subscribe.through.objects.get_or_create(
+                from_user=user, to_user=author
+            )
+            if created:
+                increment(author, subscribers_count=1)
+        if not created:
             return Response(
                 {'errors': 'Вы уже подписаны на данного пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        user.subscribe.add(author)
         serializer = SubscriptionSerializer(
-            author, data=request.data, context={'request': request}
+            author, data=request.data, context={
+                'request': request,
+                'recipes_limit': self.get_recipes_limit(request),
+            }
         )
         serializer.is_valid(raise_exception=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -57,8 +97,13 @@ class UserViewSet(djoser_views.UserViewSet):
                 {'errors': 'Вы не можете отписываться от самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if author:
-            user.subscribe.remove(author)
+        with transaction.atomic():
+            deleted, _ = User.subscribe.through.objects.filter(
+                from_user=user, to_user=author
+            ).delete()
+            if deleted:
+                increment(author, subscribers_count=-1)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(
@@ -70,37 +115,91 @@ class UserViewSet(djoser_views.UserViewSet):
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         user = request.user
-        queryset = user.subscribe.all()
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        queryset = user.subscribe.with_is_subscribed(user).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
         pagination = self.paginate_queryset(queryset)
         serializer = SubscriptionSerializer(
             pagination,
             data=list(request.data),
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes_limit': recipes_limit}
         )
         serializer.is_valid(raise_exception=True)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, ReferenceCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference_cache = tag_cache
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, ReferenceCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (CustomSearchFilter,)
-    search_fields = ('^name',)
+    filter_backends = (IngredientSearchFilter,)
+    reference_cache = ingredient_cache
+
+    def get_cached_list(self, request):
+        search = IngredientSearchFilter
+        name = request.query_params.get(search.search_param, '').strip()
+        if not name:
+            return super().get_cached_list(request)
+        return self.reference_cache.search(name, search.max_results)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, AnonymousResponseCacheMixin,
+                    CursorPaginationMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    response_cache = recipe_response_cache
     permission_classes = (IsAuthorOrIsAdminOrReadOnly,)
     pagination_class = CustomPageNumberPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return Recipe.objects.for_api(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.conditional_retrieve, *args, **kwargs
+        )
+
+    def conditional_retrieve(self, request, *args, **kwargs):
+        """Возвращает рецепт с поддержкой условных запросов.
+
+        ETag учитывает версию рецепта, его автора, флаги текущего
+        пользователя и справочники тегов и ингредиентов. Last-Modified не
+        отдается: у автора, тегов и ингредиентов нет даты изменения, и по
+        одной дате изменения рецепта клиент получил бы 304 после их
+        изменения.
+        """
+        recipe = self.get_object()
+        author = recipe.author
+        etag = make_etag(
+            recipe.id, recipe.updated_at.isoformat(),
+            recipe.id in favorite_ids_cache.get(request.user),
+            recipe.id in shopping_cart_ids_cache.get(request.user),
+            author.id, author.email, author.username, author.first_name,
+            author.last_name, author.is_subscribed,
+            tag_cache.etag, ingredient_cache.etag,
+        )
+        return self.conditional_response(
+            request, lambda: self.get_serializer(recipe).data, etag=etag
+        )
+
     def get_serializer_class(self):
         if self.action == 'list' or self.action == 'retrieve':
             return ListRetrieveRecipeSerializer
@@ -126,9 +225,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @favorite.mapping.delete
     def del_favorite(self, request, pk=None):
         recipe = get_object_or_404(Recipe, id=pk)
-        obj = Favorite.objects.filter(user=request.user, recipe=recipe)
-        if obj.exists():
-            obj.delete()
+        deleted, _ = Favorite.objects.filter(
+            user=request.user, recipe=recipe
+        ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Рецепт уже удален'},
@@ -155,9 +255,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @shopping_cart.mapping.delete
     def del_shopping_cart(self, request, pk=None):
         recipe = get_object_or_404(Recipe, id=pk)
-        obj = ShoppingCart.objects.filter(user=request.user, recipe=recipe)
-        if obj.exists():
-            obj.delete()
+        deleted, _ = ShoppingCart.objects.filter(
+            user=request.user, recipe=recipe
+        ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Рецепт уже удален'},
@@ -167,34 +268,37 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=('get',), url_path='download_shopping_cart',
             permission_classes=(IsAuthenticated,))
     def download_shopping_cart(self, request):
-        carts = ShoppingCart.objects.filter(user=request.user)
-        tmp = {}
-        for cart in carts:
-            items = cart.recipe.amountingredientforrecipes.all()
-            for item in items:
-                ingredient = item.ingredient.name
-                amount = item.amount
-                measurement_unit = item.ingredient.measurement_unit
-                if f'{ingredient}|{measurement_unit}' not in tmp:
-                    tmp[f'{ingredient}|{measurement_unit}'] = {
-                        'amount': amount
-                    }
-                else:
-                    tmp[f'{ingredient}|{measurement_unit}']['amount'] = (
-                        tmp[f'{ingredient}|{measurement_unit}']['amount']
-                        + amount
-                    )
-
-        shopping_list = []
-        for item in tmp:
-            ingredient = item.split('|')[0]
-            amount = tmp[item]["amount"]
-            measurement_unit = item.split('|')[1]
-            shopping_list.append(
-                f'{ingredient} - {amount}, {measurement_unit}\n'
-            )
-        response = HttpResponse(shopping_list, 'Content-Type: text/plain')
+        ingredients = (
+            AmountIngredientForRecipe.objects
+            .filter(recipe__shopping_carts__user=request.user)
+            .values('ingredient__name', 'ingredient__measurement_unit')
+            .annotate(amount=Sum('amount'))
+            .order_by('ingredient__name', 'ingredient__measurement_unit')
+        )
+        shopping_list = (
+            f'{item["ingredient__name"]} - {item["amount"]}, '
+            f'{item["ingredient__measurement_unit"]}\n'
+            for item in ingredients.iterator()
+        )
+        response = StreamingHttpResponse(
+            shopping_list, content_type='text/plain; charset=utf-8'
+        )
         response['Content-Disposition'] = (
             'attachment;' 'filename="shopping_list.txt"'
         )
         return response
+
+
+class ProfilingStatsView(APIView):
+    """Статистика профилирования запросов по эндпоинтам (см.
+    api.profiling). Накапливается отдельно в каждом процессе. DELETE
+    сбрасывает статистику.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(endpoint_stats.snapshot())
+
+    def delete(self, request):
+        endpoint_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
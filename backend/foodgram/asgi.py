@@ -3,5 +3,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+# Синхронный код каждого ASGI запроса выполняется в своем потоке, поэтому
+# постоянные соединения не переиспользуются, а копятся. Для переиспользования
+# соединений в ASGI режиме используется пулер (DB_POOLER=pgbouncer).
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -1,4 +1,5 @@
 import os
+from datetime import datetime, timezone
 
 from dotenv import load_dotenv
 
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +70,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Асинхронные view для тегов, ингредиентов и рецепта (api/async_views.py).
+# Включаются в foodgram/asgi.py.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE') if IS_DOCKER else 'django.db.backends.postgresql',
@@ -75,10 +83,37 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER') if IS_DOCKER else 'postgres',
         'PASSWORD': os.getenv('POSTGRES_PASSWORD') if IS_DOCKER else 'postgres',
         'HOST': os.getenv('DB_HOST') if IS_DOCKER else 'localhost',
-        'PORT': os.getenv('DB_PORT') if IS_DOCKER else '5432'
+        'PORT': os.getenv('DB_PORT') if IS_DOCKER else '5432',
+        # Сколько секунд держать соединение открытым между запросами.
+        # В ASGI режиме соединения не переиспользуются, там 0 (см. asgi.py).
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Проверять постоянное соединение перед запросом (api/signals.py).
+        'CONN_HEALTH_CHECKS': True,
+        # Через пулер в режиме transaction (pgbouncer) нельзя использовать
+        # серверные курсоры: транзакции одного соединения Django могут
+        # попасть на разные соединения PostgreSQL.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER') == 'pgbouncer',
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2 (см. api/replicas.py).
+# В тестах реплики - зеркала основной базы.
+for number, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': 5,
+    # Отметки о записях должны быть видны всем процессам (redis в docker).
+    'CACHE_ALIAS': 'responses',
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -117,6 +152,70 @@ AUTH_USER_MODEL = 'users.User'
 DIR_IMPORT_CSV = os.path.dirname(os.path.dirname(
     os.path.dirname(os.path.abspath(__file__))))
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.getenv('RESPONSE_CACHE_BACKEND') if IS_DOCKER else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION') if IS_DOCKER else 'responses',
+    },
+}
+
+REFERENCE_CACHE = {
+    'ENABLED': True,
+    # Общий для всех процессов кэш (redis в docker): сброс справочника,
+    # например командой import_csv, виден веб-серверу.
+    'CACHE_ALIAS': 'responses',
+    'TIMEOUT': 5 * 60,
+}
+
+PAGINATION_COUNT = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 30,
+    'ESTIMATE_THRESHOLD': 100000,
+}
+
+# Избранное и список покупок пользователей. Кэш должен быть общим для всех
+# процессов, иначе сброс после изменения виден только одному процессу.
+USER_RECIPES_CACHE = {
+    'CACHE_ALIAS': 'responses',
+    'TIMEOUT': 60 * 60,
+}
+
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'responses',
+    'TIMEOUT': 60,
+}
+
+IMAGE_VARIANTS = {
+    'SIZES': {'thumbnail': 160, 'card': 480, 'full': 1280},
+    'FORMAT': 'WEBP',
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+
+PROFILING = {
+    'ENABLED': DEBUG,
+    'QUERY_BUDGETS': {
+        'RecipeViewSet.list': 9,
+        'RecipeViewSet.retrieve': 9,
+        'UserViewSet.subscriptions': 5,
+        'UserViewSet.list': 4,
+        'TagViewSet.list': 1,
+        'IngredientViewSet.list': 1,
+    },
+    'RAISE_ON_BUDGET': False,
+}
+
+POPULARITY = {
+    'HALF_LIFE_DAYS': 7,
+    'FAVORITE_WEIGHT': 2.0,
+    'SHOPPING_CART_WEIGHT': 1.0,
+    'EPOCH': datetime(2022, 1, 1, tzinfo=timezone.utc),
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
@@ -0,0 +1,26 @@
+"""Настройки для тестов без PostgreSQL и с репликой для чтения.
+
+Основная база и реплика - SQLite, в тестах реплика - зеркало основной
+базы, поэтому по запросам к каждой из них видно, куда роутер отправил
+чтения (api/replicas.py).
+
+    python manage.py test --settings=foodgram.test_settings
+"""
+import os
+
+from .settings import *  # noqa: F401, F403
+from .settings import BASE_DIR, DATABASE_REPLICAS
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_REPLICAS = {**DATABASE_REPLICAS, 'ALIASES': ['replica']}
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
+from .images import get_variant_urls
 from .models import (AmountIngredientForRecipe, Favorite, Ingredient, Recipe,
                      ShoppingCart, Tag)
 
@@ -35,10 +36,11 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
 
     def get_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="80" hieght="30"')
+        url = get_variant_urls(obj)['thumbnail']
+        return mark_safe(f'<img src={url} width="80" hieght="30"')
 
     def get_cout(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     get_cout.short_description = 'Кол-во добавления в избранное'
 
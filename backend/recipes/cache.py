@@ -0,0 +1,387 @@
+import bisect
+import hashlib
+import json
+import time
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Favorite, Ingredient, ShoppingCart, Tag
+
+
+def get_reference_cache_settings():
+    """Возвращает настройки кэша справочников с подставленными значениями
+    по умолчанию.
+
+    Settings:
+        ENABLED - отдавать справочники из кэша, а не из базы данных.
+        CACHE_ALIAS - алиас кэша Django, через который кэш разделяется
+        между процессами. None - кэш хранится только в памяти процесса.
+        TIMEOUT - через сколько секунд перечитывать справочник, даже если
+        кэш не сбрасывали.
+    """
+    return {
+        'ENABLED': True,
+        'CACHE_ALIAS': None,
+        'TIMEOUT': 5 * 60,
+        **getattr(settings, 'REFERENCE_CACHE', {}),
+    }
+
+
+def get_response_cache_settings():
+    """Возвращает настройки кэша ответов API с подставленными значениями по
+    умолчанию.
+
+    Settings:
+        ENABLED - кэшировать ответы для гостей.
+        CACHE_ALIAS - алиас кэша Django, в котором хранятся ответы.
+        TIMEOUT - сколько секунд хранить ответ. Ограничивает, насколько
+        устаревшей может быть сортировка по популярности: счетчики
+        обновляются без сигналов и кэш не сбрасывают.
+    """
+    return {
+        'ENABLED': True,
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 60,
+        **getattr(settings, 'RESPONSE_CACHE', {}),
+    }
+
+
+def get_user_recipes_cache_settings():
+    """Возвращает настройки кэша id рецептов пользователя (избранное,
+    список покупок) с подставленными значениями по умолчанию.
+
+    Settings:
+        CACHE_ALIAS - алиас кэша Django, в котором хранятся наборы id.
+        TIMEOUT - сколько секунд хранить набор id.
+    """
+    return {
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 60 * 60,
+        **getattr(settings, 'USER_RECIPES_CACHE', {}),
+    }
+
+
+class ReferenceCache:
+    """Read-through кэш справочной таблицы.
+
+    Хранит строки таблицы в виде словарей в памяти процесса. Если в
+    настройках задан CACHE_ALIAS, строки дополнительно кладутся в кэш Django,
+    а актуальность копии в памяти проверяется по версии из этого кэша - так
+    сброс кэша в одном процессе виден всем остальным. Копия в памяти и в
+    кэше Django перечитывается не реже, чем раз в TIMEOUT секунд, даже если
+    таблицу изменили в обход сигналов.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.key_prefix = f'reference:{model._meta.label_lower}'
+        # (данные, версия, поколение, время загрузки) - заменяются одним
+        # присваиванием, поэтому другой поток не увидит их наполовину
+        # обновленными.
+        self._state = None
+        self._generation = 0
+
+    @property
+    def version_key(self):
+        return f'{self.key_prefix}:version'
+
+    def _shared_cache(self):
+        alias = get_reference_cache_settings()['CACHE_ALIAS']
+        return caches[alias] if alias else None
+
+    def _fetch(self):
+        # Кэш общий для всех запросов, поэтому заполняется из основной
+        # базы, а не из реплики, которая может отставать.
+        return list(
+            self.model.objects.using(DEFAULT_DB_ALIAS).values(*self.fields)
+        )
+
+    def _make_snapshot(self, rows):
+        """Возвращает данные, с которыми работают методы кэша."""
+        return {
+            'rows': rows,
+            'by_id': {row['id']: row for row in rows},
+            'etag': hashlib.md5(
+                json.dumps(rows, sort_keys=True, default=str).encode(),
+                usedforsecurity=False
+            ).hexdigest(),
+        }
+
+    def _is_fresh(self, version=None):
+        if self._state is None:
+            return False
+        _, loaded_version, generation, loaded_at = self._state
+        return (
+            generation == self._generation and loaded_version == version
+            and time.monotonic() - loaded_at
+            < get_reference_cache_settings()['TIMEOUT']
+        )
+
+    def _get_version(self, shared):
+        """Возвращает версию справочника из общего кэша."""
+        version = shared.get(self.version_key)
+        if version is None:
+            shared.add(self.version_key, uuid4().hex, timeout=None)
+            version = shared.get(self.version_key)
+        return version
+
+    def _reload(self, shared, version):
+        """Перечитывает данные версии version из общего кэша или, если их
+        там нет, из таблицы.
+        """
+        # Поколение запоминается до чтения таблицы: если кэш сбросят во
+        # время чтения, прочитанные данные сразу будут считаться устаревшими.
+        generation = self._generation
+        if shared is None:
+            rows = self._fetch()
+        else:
+            data_key = f'{self.key_prefix}:{version}'
+            rows = shared.get(data_key)
+            if rows is None:
+                rows = self._fetch()
+                shared.set(
+                    data_key, rows, get_reference_cache_settings()['TIMEOUT']
+                )
+        snapshot = self._make_snapshot(rows)
+        self._state = (snapshot, version, generation, time.monotonic())
+        return snapshot
+
+    def _load(self):
+        """Возвращает актуальные данные кэша, при необходимости перечитывая
+        таблицу.
+        """
+        shared = self._shared_cache()
+        version = None if shared is None else self._get_version(shared)
+        if self._is_fresh(version):
+            return self._state[0]
+        return self._reload(shared, version)
+
+    async def _aload(self):
+        """Асинхронный вариант _load().
+
+        Версия читается из общего кэша в отдельном потоке
+        (thread_sensitive=False), как в ResponseCache.aget, и не ждет
+        синхронные view. В их поток выносится только перечитывание данных,
+        которому может понадобиться база данных.
+        """
+        shared = self._shared_cache()
+        version = None
+        if shared is not None:
+            version = await sync_to_async(
+                self._get_version, thread_sensitive=False
+            )(shared)
+        if self._is_fresh(version):
+            return self._state[0]
+        return await sync_to_async(self._reload)(shared, version)
+
+    @staticmethod
+    def _get_row(snapshot, pk):
+        try:
+            return snapshot['by_id'].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def all(self):
+        """Возвращает все строки таблицы."""
+        return self._load()['rows']
+
+    def get(self, pk):
+        """Возвращает строку по id или None, если ее нет."""
+        return self._get_row(self._load(), pk)
+
+    @property
+    def etag(self):
+        """Хэш содержимого таблицы, меняется при любом ее изменении."""
+        return self._load()['etag']
+
+    async def aall(self):
+        return (await self._aload())['rows']
+
+    async def aget(self, pk):
+        return self._get_row(await self._aload(), pk)
+
+    async def aetag(self):
+        return (await self._aload())['etag']
+
+    def invalidate(self):
+        """Сбрасывает кэш. Следующее обращение перечитает таблицу."""
+        self._generation += 1
+        shared = self._shared_cache()
+        if shared is not None:
+            shared.set(self.version_key, uuid4().hex, timeout=None)
+
+
+class IngredientCache(ReferenceCache):
+    """Кэш ингредиентов с поиском по названию без обращения к базе.
+
+    Для поиска по префиксу хранит отсортированный массив названий в нижнем
+    регистре, диапазон совпадений находится бинарным поиском.
+    """
+
+    def _make_snapshot(self, rows):
+        snapshot = super()._make_snapshot(rows)
+        snapshot['sorted'] = sorted(
+            rows, key=lambda row: (row['name'].lower(), row['id'])
+        )
+        snapshot['names'] = [row['name'].lower() for row in snapshot['sorted']]
+        return snapshot
+
+    def search(self, name, limit):
+        """Ищет ингредиенты по названию.
+
+        Сначала возвращаются ингредиенты, название которых начинается с
+        name, затем - содержащие name. Не больше limit элементов.
+        """
+        return self._search(self._load(), name, limit)
+
+    async def asearch(self, name, limit):
+        return self._search(await self._aload(), name, limit)
+
+    @staticmethod
+    def _search(snapshot, name, limit):
+        rows, names = snapshot['sorted'], snapshot['names']
+        name = name.lower()
+        start = bisect.bisect_left(names, name)
+        end = start
+        while (end < len(names) and end - start < limit
+               and names[end].startswith(name)):
+            end += 1
+        result = rows[start:end]
+        if len(result) < limit:
+            result += [
+                row for row, row_name in zip(rows, names)
+                if name in row_name and not row_name.startswith(name)
+            ][:limit - len(result)]
+        return result
+
+
+class ResponseCache:
+    """Кэш готовых ответов API с версионированными ключами.
+
+    Ключ ответа содержит текущую версию, поэтому сброс кэша - это просто
+    смена версии: старые ответы перестают находиться и со временем
+    вытесняются самим кэшем.
+    """
+
+    def __init__(self, name):
+        self.key_prefix = f'response:{name}'
+
+    @property
+    def version_key(self):
+        return f'{self.key_prefix}:version'
+
+    def _cache(self):
+        return caches[get_response_cache_settings()['CACHE_ALIAS']]
+
+    def _make_key(self, cache, key):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+        return f'{self.key_prefix}:{version}:{digest}'
+
+    def get(self, key):
+        """Возвращает сохраненный ответ или None."""
+        cache = self._cache()
+        return cache.get(self._make_key(cache, key))
+
+    async def aget(self, key):
+        """Асинхронный вариант get(). Кэш не использует базу данных,
+        поэтому вызов не занимает поток, в котором выполняются запросы к
+        ней.
+        """
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    def set(self, key, value):
+        """Сохраняет ответ на TIMEOUT секунд."""
+        cache = self._cache()
+        cache.set(
+            self._make_key(cache, key), value,
+            get_response_cache_settings()['TIMEOUT']
+        )
+
+    def invalidate(self):
+        """Сбрасывает все сохраненные ответы."""
+        self._cache().set(self.version_key, uuid4().hex, timeout=None)
+
+
+class UserRecipesCache:
+    """Кэш множества id рецептов, связанных с пользователем через model
+    (Favorite, ShoppingCart).
+
+    Множество загружается один раз за запрос: оно запоминается на объекте
+    пользователя, а между запросами хранится в кэше Django. Проверка, есть ли
+    рецепт в множестве, не обращается к базе данных. Ключ множества содержит
+    версию пользователя, которую меняет invalidate(), поэтому множество,
+    прочитанное из базы до сброса, не перезапишет кэш после него.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.key_prefix = f'user-recipes:{model._meta.label_lower}'
+        self.attr_name = f'_{model._meta.model_name}_recipe_ids'
+
+    def _cache(self):
+        return caches[get_user_recipes_cache_settings()['CACHE_ALIAS']]
+
+    def _version_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}:version'
+
+    def _fetch(self, user):
+        # Читаем из основной базы: в реплике может еще не быть только что
+        # добавленного рецепта, и устаревший набор остался бы в кэше.
+        return list(
+            self.model.objects.using(DEFAULT_DB_ALIAS).filter(user=user)
+            .values_list('recipe_id', flat=True)
+        )
+
+    def get(self, user):
+        """Возвращает frozenset id рецептов пользователя user. Для гостя -
+        пустое множество.
+        """
+        if user.is_anonymous:
+            return frozenset()
+        ids = getattr(user, self.attr_name, None)
+        if ids is not None:
+            return ids
+        cache = self._cache()
+        timeout = get_user_recipes_cache_settings()['TIMEOUT']
+        version_key = self._version_key(user.id)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid4().hex, timeout)
+            version = cache.get(version_key)
+        key = f'{self.key_prefix}:{user.id}:{version}'
+        ids = cache.get(key)
+        if ids is None:
+            ids = self._fetch(user)
+            cache.set(key, ids, timeout)
+        ids = frozenset(ids)
+        setattr(user, self.attr_name, ids)
+        return ids
+
+    def invalidate(self, user):
+        """Сбрасывает множество пользователя user. Принимает пользователя
+        или его id.
+        """
+        self._cache().set(
+            self._version_key(getattr(user, 'id', user)), uuid4().hex,
+            get_user_recipes_cache_settings()['TIMEOUT']
+        )
+        if hasattr(user, self.attr_name):
+            delattr(user, self.attr_name)
+
+
+tag_cache = ReferenceCache(Tag, ('id', 'name', 'color', 'slug'))
+ingredient_cache = IngredientCache(
+    Ingredient, ('id', 'name', 'measurement_unit')
+)
+recipe_response_cache = ResponseCache('recipes')
+favorite_ids_cache = UserRecipesCache(Favorite)
+shopping_cart_ids_cache = UserRecipesCache(ShoppingCart)
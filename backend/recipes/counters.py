@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', User.subscribe.through, 'to_user'),
+)
+
+
+def increment(obj, **deltas):
+    """Атомарно изменяет счетчики объекта obj: increment(obj, field=delta).
+
+    Значения меняются выражениями F() на стороне базы данных одним
+    запросом, поэтому параллельные запросы не затирают изменения друг друга.
+    """
+    type(obj).objects.filter(pk=obj.pk).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def reconcile():
+    """Пересчитывает все денормализованные счетчики по исходным таблицам.
+
+    Returns:
+        dict: {'Модель.счетчик': количество исправленных строк}.
+    """
+    fixed = {}
+    for model, field, source, source_field in COUNTERS:
+        actual = Coalesce(Subquery(
+            source.objects.filter(**{source_field: OuterRef('pk')})
+            .order_by().values(source_field)
+            .annotate(count=Count('pk')).values('count')
+        ), Value(0))
+        fixed[f'{model.__name__}.{field}'] = (
+            model.objects.exclude(**{field: actual}).update(**{field: actual})
+        )
+    return fixed
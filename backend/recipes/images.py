@@ -0,0 +1,153 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.utils import timezone
+from PIL import Image
+
+from .cache import recipe_response_cache
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def get_image_variants_settings():
+    """Возвращает настройки уменьшенных копий картинок рецептов с
+    подставленными значениями по умолчанию.
+
+    Settings:
+        SIZES - {название копии: максимальная сторона в пикселях}.
+        FORMAT - формат, в котором сохраняются копии.
+        QUALITY - качество сжатия копий.
+        WORKERS - количество фоновых потоков, в которых строятся копии.
+        0 - копии строятся сразу, в текущем потоке.
+    """
+    return {
+        'SIZES': {'thumbnail': 160, 'card': 480, 'full': 1280},
+        'FORMAT': 'WEBP',
+        'QUALITY': 80,
+        'WORKERS': 2,
+        **getattr(settings, 'IMAGE_VARIANTS', {}),
+    }
+
+
+def get_variant_urls(recipe):
+    """Возвращает {название копии: url} для картинки рецепта. Пока копия
+    не построена, вместо нее отдается url оригинала.
+    """
+    if not recipe.image:
+        return {name: None for name in get_image_variants_settings()['SIZES']}
+    variants = recipe.image_variants
+    if variants.get('source') != recipe.image.name:
+        variants = {}
+    storage = recipe.image.storage
+    return {
+        name: storage.url(variants[name]) if name in variants
+        else recipe.image.url
+        for name in get_image_variants_settings()['SIZES']
+    }
+
+
+def variants_outdated(recipe):
+    """Проверяет, нужно ли строить копии картинки рецепта."""
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') != recipe.image.name
+    )
+
+
+def build_variants(recipe_id):
+    """Строит уменьшенные копии картинки рецепта и сохраняет их имена в
+    Recipe.image_variants. Если пока копии строились картинку заменили,
+    результат не сохраняется.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    variants_settings = get_image_variants_settings()
+    source = recipe.image.name
+    storage = recipe.image.storage
+    path = PurePosixPath(source)
+    extension = variants_settings['FORMAT'].lower()
+    variants = {'source': source}
+    with storage.open(source, 'rb') as file, Image.open(file) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for name, size in variants_settings['SIZES'].items():
+            variant = image.copy()
+            variant.thumbnail((size, size))
+            buffer = BytesIO()
+            variant.save(
+                buffer, variants_settings['FORMAT'],
+                quality=variants_settings['QUALITY']
+            )
+            variants[name] = storage.save(
+                str(path.parent / 'variants' / f'{path.stem}_{name}.'
+                    f'{extension}'),
+                ContentFile(buffer.getvalue())
+            )
+    updated = Recipe.objects.filter(id=recipe_id, image=source).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        recipe_response_cache.invalidate()
+
+
+def _build_variants_in_thread(recipe_id):
+    try:
+        build_variants(recipe_id)
+    except Exception:
+        logger.exception('Failed to build image variants for recipe %s',
+                         recipe_id)
+    finally:
+        connection.close()
+
+
+def _get_executor(workers):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='image-variants'
+            )
+    return _executor
+
+
+def schedule_variants(recipe_id):
+    """Ставит построение копий картинки рецепта в очередь фоновых потоков.
+    Копии, не построенные до перезапуска процесса, достраивает команда
+    build_image_variants.
+    """
+    workers = get_image_variants_settings()['WORKERS']
+    if not workers:
+        build_variants(recipe_id)
+        return
+    future = _get_executor(workers).submit(
+        _build_variants_in_thread, recipe_id
+    )
+    with _executor_lock:
+        _pending.add(future)
+    future.add_done_callback(_discard_pending)
+
+
+def _discard_pending(future):
+    with _executor_lock:
+        _pending.discard(future)
+
+
+def wait_for_variants(timeout=None):
+    """Ждет, пока построятся копии, поставленные в очередь этим
+    процессом.
+    """
+    with _executor_lock:
+        futures = list(_pending)
+    wait(futures, timeout)
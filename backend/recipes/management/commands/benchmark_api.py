@@ -0,0 +1,272 @@
+import base64
+import json
+import math
+import random
+import statistics
+import subprocess
+import time
+from contextlib import ExitStack
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.images import wait_for_variants
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Drives the key API endpoints with the Django test client and '
+            'reports latency percentiles and query counts as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Number of measured requests per scenario.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Number of requests per scenario made before measuring.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed for choosing recipes and ingredients.'
+        )
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Run only this scenario (can be repeated).'
+        )
+        parser.add_argument(
+            '--output', help='Write the JSON report to this file.'
+        )
+        parser.add_argument(
+            '--conn-max-age', type=int,
+            help=('Override CONN_MAX_AGE of every database connection '
+                  '(including replicas), e.g. 0 to measure reconnecting on '
+                  'every request.')
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be a positive number!')
+        if not Recipe.objects.exists():
+            raise CommandError('No recipes found, run generate_data first!')
+        if 'testserver' not in settings.ALLOWED_HOSTS:
+            settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        if options['conn_max_age'] is not None:
+            for alias in connections:
+                connections[alias].close()
+                connections[alias].settings_dict['CONN_MAX_AGE'] = (
+                    options['conn_max_age']
+                )
+        self.rng = random.Random(options['seed'])
+        user = self._get_user()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.anonymous_client = Client()
+        self.created_ids = []
+
+        scenarios = self._get_scenarios()
+        names = options['scenario'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(
+                'Unknown scenarios: ' + ', '.join(sorted(unknown))
+            )
+        report = {'meta': self._get_meta(user, options), 'scenarios': {}}
+        try:
+            for name in names:
+                self.stderr.write(f'Running {name}...')
+                report['scenarios'][name] = self._run(
+                    scenarios[name], options
+                )
+        finally:
+            self._delete_created_recipes()
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def _get_user(self):
+        """Returns a user who has a shopping cart and subscriptions."""
+        user = User.objects.filter(
+            shopping_carts__isnull=False, subscribe__isnull=False
+        ).order_by('id').first()
+        return user or User.objects.order_by('id').first()
+
+    def _get_meta(self, user, options):
+        try:
+            commit = subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'databases': list(connections),
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'user_id': user.id,
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'seed': options['seed'],
+        }
+
+    def _get_scenarios(self):
+        """Returns {name: function making one request}."""
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        ingredient_names = list(
+            Ingredient.objects.values_list('name', flat=True)
+        )
+        get = self.client.get
+        return {
+            'recipe_list': lambda: get('/api/recipes/'),
+            'recipe_list_anonymous': (
+                lambda: self.anonymous_client.get('/api/recipes/')
+            ),
+            'recipe_list_filtered': lambda: get(
+                '/api/recipes/', {
+                    'tags': self.rng.sample(
+                        tag_slugs, min(2, len(tag_slugs))
+                    ),
+                    'is_favorited': 1,
+                }
+            ),
+            'recipe_list_popular': lambda: get(
+                '/api/recipes/', {'ordering': 'popular'}
+            ),
+            'recipe_list_deep_page': lambda: get(
+                '/api/recipes/', {'page': 50, 'limit': 6}
+            ),
+            'recipe_retrieve': lambda: get(
+                f'/api/recipes/{self.rng.choice(recipe_ids)}/'
+            ),
+            'subscriptions': lambda: get(
+                '/api/users/subscriptions/', {'recipes_limit': 3}
+            ),
+            'download_shopping_cart': lambda: get(
+                '/api/recipes/download_shopping_cart/'
+            ),
+            'ingredient_search': lambda: get(
+                '/api/ingredients/',
+                {'name': self.rng.choice(ingredient_names)[:3]}
+            ),
+            'recipe_create': self._create_recipe,
+        }
+
+    def _create_recipe(self):
+        if not hasattr(self, '_image'):
+            buffer = BytesIO()
+            Image.new('RGB', (800, 600), (120, 180, 90)).save(buffer, 'PNG')
+            self._image = ('data:image/png;base64,'
+                           + base64.b64encode(buffer.getvalue()).decode())
+            self._tag_ids = list(Tag.objects.values_list('id', flat=True))
+            self._ingredient_ids = list(
+                Ingredient.objects.values_list('id', flat=True)[:1000]
+            )
+        response = self.client.post('/api/recipes/', {
+            'name': 'Benchmark recipe',
+            'text': 'Benchmark recipe',
+            'cooking_time': 10,
+            'image': self._image,
+            'tags': self.rng.sample(self._tag_ids, 1),
+            'ingredients': [
+                {'id': id, 'amount': 10}
+                for id in self.rng.sample(
+                    self._ingredient_ids, min(5, len(self._ingredient_ids))
+                )
+            ],
+        }, content_type='application/json')
+        if response.status_code == 201:
+            self.created_ids.append(response.json()['id'])
+        return response
+
+    def _delete_created_recipes(self):
+        """Deletes the recipes made by recipe_create together with their
+        images and image variants, which deleting a recipe leaves behind.
+        """
+        wait_for_variants()
+        files = []
+        for recipe in Recipe.objects.filter(id__in=self.created_ids):
+            if recipe.image:
+                files.append((recipe.image.storage, {
+                    recipe.image.name, *recipe.image_variants.values()
+                }))
+        for id in self.created_ids:
+            self.client.delete(f'/api/recipes/{id}/')
+        for storage, names in files:
+            for name in names:
+                storage.delete(name)
+
+    def _request(self, make_request):
+        """Makes one request and returns (status, seconds, queries). The
+        body of a streaming response is read inside the measurement.
+
+        The test client keeps the database connection open between
+        requests, so after each request old connections are closed the
+        way a real server does it - this honours CONN_MAX_AGE. Queries are
+        counted on every database, reads may go to a replica.
+        """
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(count_query)
+                )
+            response = make_request()
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        elapsed = time.perf_counter() - started
+        close_old_connections()
+        return response.status_code, elapsed, queries
+
+    def _run(self, make_request, options):
+        for _ in range(options['warmup']):
+            self._request(make_request)
+        timings, query_counts, statuses = [], [], {}
+        for _ in range(options['requests']):
+            status, elapsed, queries = self._request(make_request)
+            timings.append(elapsed * 1000)
+            query_counts.append(queries)
+            statuses[status] = statuses.get(status, 0) + 1
+        return {
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries_p50': statistics.median_low(query_counts),
+            'queries_max': max(query_counts),
+            'status_codes': {
+                str(status): count for status, count in statuses.items()
+            },
+        }
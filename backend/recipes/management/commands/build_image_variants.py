@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants, variants_outdated
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Builds resized copies of recipe images that are missing or '
+            'outdated (or of all images with --force)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild copies of all recipe images.'
+        )
+
+    def handle(self, *args, **options):
+        built = 0
+        recipes = Recipe.objects.only('id', 'image', 'image_variants')
+        for recipe in recipes.iterator():
+            if not (options['force'] or variants_outdated(recipe)):
+                continue
+            try:
+                build_variants(recipe.id)
+            except OSError as error:
+                self.stderr.write(f'Recipe {recipe.id}: {error}')
+                continue
+            built += 1
+        self.stdout.write(f'Image variants built for {built} recipes')
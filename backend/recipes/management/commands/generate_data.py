@@ -0,0 +1,182 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+from tqdm import tqdm
+
+from recipes.cache import recipe_response_cache
+from recipes.counters import reconcile
+from recipes.models import (AmountIngredientForRecipe, Favorite, Ingredient,
+                            Recipe, ShoppingCart, Tag)
+from recipes.popularity import refresh
+
+User = get_user_model()
+
+PASSWORD = 'benchmark'
+IMAGE_NAME = 'recipes/images/benchmark.png'
+
+
+class Command(BaseCommand):
+    help = ('Generates synthetic users, recipes, favorites, shopping carts '
+            'and subscriptions. Ingredients and tags must already be '
+            'loaded (see import_csv).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=6
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument(
+            '--subscriptions-per-user', type=int, default=10
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed generates the same data.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not self.ingredient_ids or not self.tag_ids:
+            raise CommandError(
+                'No ingredients or tags found, run import_csv first!'
+            )
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('--users and --recipes must be positive!')
+
+        with transaction.atomic():
+            user_ids = self._create_users(options['users'])
+            recipe_ids = self._create_recipes(
+                options['recipes'], user_ids, options
+            )
+            self._create_user_recipes(
+                Favorite, user_ids, recipe_ids,
+                options['favorites_per_user']
+            )
+            self._create_user_recipes(
+                ShoppingCart, user_ids, recipe_ids, options['carts_per_user']
+            )
+            self._create_subscriptions(
+                user_ids, options['subscriptions_per_user']
+            )
+            self._reset_sequences()
+            reconcile()
+            refresh()
+        recipe_response_cache.invalidate()
+        self.stdout.write(
+            f'Generated {len(user_ids)} users and {len(recipe_ids)} '
+            f'recipes. Password of every user: "{PASSWORD}"'
+        )
+
+    def _bulk_create(self, model, objects, total):
+        """Saves objects (a generator) in batches with a progress bar."""
+        self.stdout.write(f'\nSaving data to table "{model.__name__}":')
+        with tqdm(total=total, unit=' rows') as progress:
+            while batch := list(islice(objects, self.batch_size)):
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                progress.update(len(batch))
+
+    def _next_id(self, model):
+        last = model.objects.order_by('-id').values_list('id', flat=True)
+        return (last.first() or 0) + 1
+
+    def _create_users(self, count):
+        start = self._next_id(User)
+        password = make_password(PASSWORD)
+        ids = range(start, start + count)
+        self._bulk_create(User, (
+            User(
+                id=id, username=f'bench_user_{id}',
+                email=f'bench_user_{id}@example.com',
+                first_name=f'Имя {id}', last_name=f'Фамилия {id}',
+                password=password
+            )
+            for id in ids
+        ), count)
+        return list(ids)
+
+    def _create_recipes(self, count, user_ids, options):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (640, 480), (230, 160, 60)).save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        start = self._next_id(Recipe)
+        ids = range(start, start + count)
+        self._bulk_create(Recipe, (
+            Recipe(
+                id=id, author_id=self.rng.choice(user_ids),
+                name=f'Рецепт {id}', image=IMAGE_NAME,
+                text=f'Описание рецепта {id}. ' * 5,
+                cooking_time=self.rng.randint(1, 180)
+            )
+            for id in ids
+        ), count)
+        self._bulk_create(AmountIngredientForRecipe, (
+            AmountIngredientForRecipe(
+                recipe_id=id, ingredient_id=ingredient_id,
+                amount=self.rng.randint(1, 500)
+            )
+            for id in ids
+            for ingredient_id in self._sample(
+                self.ingredient_ids, options['ingredients_per_recipe']
+            )
+        ), count * options['ingredients_per_recipe'])
+        self._bulk_create(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=id, tag_id=tag_id)
+            for id in ids
+            for tag_id in self._sample(
+                self.tag_ids, options['tags_per_recipe']
+            )
+        ), count * options['tags_per_recipe'])
+        return list(ids)
+
+    def _create_user_recipes(self, model, user_ids, recipe_ids, per_user):
+        now = timezone.now()
+        self._bulk_create(model, (
+            model(
+                user_id=user_id, recipe_id=recipe_id,
+                created=now - timedelta(minutes=self.rng.randint(0, 43200))
+            )
+            for user_id in user_ids
+            for recipe_id in self._sample(recipe_ids, per_user)
+        ), len(user_ids) * per_user)
+
+    def _create_subscriptions(self, user_ids, per_user):
+        through = User.subscribe.through
+        self._bulk_create(through, (
+            through(from_user_id=user_id, to_user_id=author_id)
+            for user_id in user_ids
+            for author_id in self._sample(user_ids, per_user + 1)
+            if author_id != user_id
+        ), len(user_ids) * per_user)
+
+    def _sample(self, population, count):
+        return self.rng.sample(population, min(count, len(population)))
+
+    def _reset_sequences(self):
+        """Moves the id sequences past the ids inserted explicitly."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -1,51 +1,253 @@
 import csv
+import io
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 from tqdm import tqdm
 
+from recipes.cache import ingredient_cache, recipe_response_cache, tag_cache
+from recipes.counters import reconcile
+from recipes.popularity import refresh
+
 from ._csv_data_relations import csv_data_relation
 
+MODE_INSERT = 'insert'
+MODE_IGNORE = 'ignore'
+MODE_UPSERT = 'upsert'
+
 
 class Command(BaseCommand):
     help = 'Imports csv data from files in staic/data/ into database'
 
-    def handle(self, *args, **kwargs):
-        objects = self._create_list_of_model_objects(csv_data_relation)
-        for obj_list in objects:
-            table_name = type(obj_list[0]).__name__
-            self.stdout.write(f'\nSaving data to table "{table_name}":')
-            for obj in tqdm(obj_list):
-                obj.save()
-
-    def _create_model_objects_from_csv_data(self, csv_file, model):
-        """Returns list of model objects, populated from csv_file data."""
-        model_objects = []
-        with open(csv_file, encoding='utf-8', newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if 'NULL' in row.values():
-                    row = dict((x, None) if row[x] == 'NULL' else (
-                        x, y) for x, y in row.items())
-                model_object = model(**row)
-                model_objects.append(model_object)
-        return model_objects
-
-    def _create_list_of_model_objects(self, csv_data_relation):
-        """Create a list of model object lists."""
-        model_objects_list = []
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows inserted per query.'
+        )
+        parser.add_argument(
+            '--mode', choices=(MODE_INSERT, MODE_IGNORE, MODE_UPSERT),
+            default=MODE_INSERT,
+            help=('insert - fail on conflicts, ignore - skip conflicting '
+                  'rows, upsert - update existing rows by id.')
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Use PostgreSQL COPY FROM (insert mode only).'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help=('Number of tables loaded concurrently. A table starts '
+                  'once all tables it references are loaded.')
+        )
+
+    def handle(self, *args, **options):
+        if options['copy']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--copy is supported on PostgreSQL only!')
+            if options['mode'] != MODE_INSERT:
+                raise CommandError('--copy can be used in insert mode only!')
+
         csv_dir = Path(settings.DIR_IMPORT_CSV) / 'data'
+        csv_files = []
         for csv_pair in csv_data_relation:
             csv_file = csv_dir / csv_pair['filename']
-            model = csv_pair['model']
             if not csv_file.exists():
                 raise CommandError(
                     f'File {csv_file} not found!'
                 )
-            model_objects = self._create_model_objects_from_csv_data(
-                csv_file,
-                model
+            csv_files.append((csv_file, csv_pair['model']))
+
+        if options['workers'] < 1:
+            raise CommandError('--workers must be a positive number!')
+        if options['workers'] == 1:
+            for csv_file, model in csv_files:
+                self._import_table(csv_file, model, options)
+        else:
+            self._import_parallel(csv_files, options)
+
+        # bulk_create sends no signals, so counters and popularity are
+        # recalculated from scratch.
+        with transaction.atomic():
+            reconcile()
+            refresh()
+        tag_cache.invalidate()
+        ingredient_cache.invalidate()
+        recipe_response_cache.invalidate()
+
+    def _get_dependencies(self, csv_files):
+        """Returns {model: set of models it references} for the imported
+        models. Only foreign keys to other imported models are counted.
+        """
+        models = {model for _, model in csv_files}
+        return {
+            model: {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model in models
+                and field.related_model is not model
+            }
+            for model in models
+        }
+
+    def _import_parallel(self, csv_files, options):
+        """Loads tables on a pool of options['workers'] threads. Each thread
+        uses its own database connection. A table is submitted as soon as
+        every table it references is loaded.
+        """
+        dependencies = self._get_dependencies(csv_files)
+        pending = {model: csv_file for csv_file, model in csv_files}
+        loaded = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while pending or running:
+                for model in [model for model in pending
+                              if dependencies[model] <= loaded]:
+                    future = executor.submit(
+                        self._import_table_in_thread,
+                        pending.pop(model), model, options
+                    )
+                    running[future] = model
+                if not running:
+                    raise CommandError(
+                        'Circular dependency between tables: '
+                        + ', '.join(model.__name__ for model in pending)
+                    )
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    model = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as error:
+                        for other in running:
+                            other.cancel()
+                        raise CommandError(
+                            f'Failed to import "{model.__name__}": {error}'
+                        ) from error
+                    loaded.add(model)
+
+    def _import_table_in_thread(self, csv_file, model, options):
+        try:
+            self._import_table(csv_file, model, options,
+                               show_progress=False)
+        finally:
+            connection.close()
+
+    def _import_table(self, csv_file, model, options, show_progress=True):
+        """Loads one csv_file into the model table and reports the speed."""
+        table_name = model.__name__
+        self.stdout.write(f'\nSaving data to table "{table_name}":')
+        started = time.perf_counter()
+        rows = 0
+        with transaction.atomic(), tqdm(
+            unit=' rows', disable=not show_progress
+        ) as progress:
+            for columns, batch in self._read_batches(
+                csv_file, model, options['batch_size']
+            ):
+                if options['copy']:
+                    self._copy_batch(model, batch)
+                elif options['mode'] == MODE_UPSERT:
+                    self._upsert_batch(model, columns, batch)
+                else:
+                    model.objects.bulk_create(
+                        batch,
+                        ignore_conflicts=options['mode'] == MODE_IGNORE
+                    )
+                rows += len(batch)
+                progress.update(len(batch))
+            self._reset_sequences(model)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{table_name}: {rows} rows in {elapsed:.2f}s '
+            f'({rows / elapsed if elapsed else rows:.0f} rows/sec)'
+        )
+
+    def _read_batches(self, csv_file, model, batch_size):
+        """Yields (columns, list of model objects) pairs populated from
+        csv_file data, batch_size objects at a time.
+        """
+        with open(csv_file, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            objects = (
+                model(**self._clean_row(row)) for row in reader
+            )
+            while batch := list(islice(objects, batch_size)):
+                yield reader.fieldnames, batch
+
+    def _clean_row(self, row):
+        """Replaces 'NULL' strings with None."""
+        if 'NULL' in row.values():
+            row = dict((x, None) if row[x] == 'NULL' else (
+                x, y) for x, y in row.items())
+        return row
+
+    def _upsert_batch(self, model, columns, batch):
+        """Updates rows that already exist (by id) and inserts the rest.
+        Only the columns present in the csv file are updated. Files without
+        an id column are inserted skipping conflicting rows.
+        """
+        pk = model._meta.pk
+        if pk.attname not in columns:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            return
+        for obj in batch:
+            obj.pk = pk.to_python(obj.pk)
+        existing = set(model.objects.filter(
+            pk__in=[obj.pk for obj in batch]
+        ).values_list('pk', flat=True))
+        update_fields = [
+            model._meta.get_field(column).name
+            for column in columns if column != pk.attname
+        ]
+        to_update = [obj for obj in batch if obj.pk in existing]
+        if to_update and update_fields:
+            model.objects.bulk_update(to_update, update_fields)
+        model.objects.bulk_create(
+            [obj for obj in batch if obj.pk not in existing]
+        )
+
+    def _copy_batch(self, model, batch):
+        """Inserts a batch with PostgreSQL COPY FROM. Values are prepared
+        from model objects, so fields missing from the csv file get their
+        model defaults.
+        """
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not (field.primary_key and batch[0].pk is None)
+        ]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in batch:
+            writer.writerow(
+                r'\N' if value is None else value
+                for value in (
+                    field.get_db_prep_save(
+                        field.pre_save(obj, True), connection
+                    )
+                    for field in fields
+                )
             )
-            model_objects_list.append(model_objects)
-        return model_objects_list
+        buffer.seek(0)
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({columns}) FROM STDIN "
+                r"WITH (FORMAT csv, NULL '\N')",
+                buffer
+            )
+
+    def _reset_sequences(self, model):
+        """Moves the id sequence past the ids inserted explicitly."""
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalculates denormalized counters of recipes and users'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            fixed = reconcile()
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: {rows} rows fixed')
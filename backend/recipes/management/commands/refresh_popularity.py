@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.popularity import needs_rebase, rebase, refresh
+
+
+class Command(BaseCommand):
+    help = ('Recalculates popularity of recipes added to favorites or '
+            'shopping carts recently (or of all recipes with --full). '
+            'Moves the popularity epoch forward when scores grow too big.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since-minutes', type=int, default=60,
+            help='Refresh recipes with activity in the last N minutes.'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Refresh all recipes.'
+        )
+
+    def handle(self, *args, **options):
+        if needs_rebase():
+            refreshed = rebase()
+            self.stdout.write(
+                f'Popularity epoch moved, {refreshed} recipes refreshed'
+            )
+            return
+        since = None
+        if not options['full']:
+            since = timezone.now() - timedelta(
+                minutes=options['since_minutes']
+            )
+        with transaction.atomic():
+            refreshed = refresh(since)
+        self.stdout.write(f'Popularity refreshed for {refreshed} recipes')
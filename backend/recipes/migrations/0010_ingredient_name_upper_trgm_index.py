@@ -0,0 +1,49 @@
+from django.db import migrations
+
+OLD_INDEX_NAME = 'recipes_ingredient_name_trgm'
+INDEX_NAME = 'recipes_ingredient_name_upper_trgm'
+
+
+def pg_trgm_available(schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        return cursor.fetchone() is not None
+
+
+def create_upper_trgm_index(apps, schema_editor):
+    # name__icontains и name__istartswith на PostgreSQL компилируются в
+    # UPPER("name"::text) LIKE UPPER(...), индекс должен быть построен по
+    # тому же выражению.
+    if not pg_trgm_available(schema_editor):
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        'USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+    schema_editor.execute(f'DROP INDEX IF EXISTS {OLD_INDEX_NAME}')
+
+
+def create_plain_trgm_index(apps, schema_editor):
+    if not pg_trgm_available(schema_editor):
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {OLD_INDEX_NAME} '
+        'ON recipes_ingredient USING gin (name gin_trgm_ops)'
+    )
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trgm_index, create_plain_trgm_index),
+    ]
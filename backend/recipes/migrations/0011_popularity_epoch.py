@@ -0,0 +1,25 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_name_upper_trgm_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='начало отсчета')),
+            ],
+            options={
+                'verbose_name': 'точка отсчета рейтинга',
+                'verbose_name_plural': 'точки отсчета рейтинга',
+                'ordering': ['id'],
+            },
+        ),
+    ]
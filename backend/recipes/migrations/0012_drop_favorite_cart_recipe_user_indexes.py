@@ -0,0 +1,21 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:19
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_popularity_epoch'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='favorite',
+            name='favorite_recipe_user_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shoppingcart',
+            name='shopping_cart_recipe_user_idx',
+        ),
+    ]
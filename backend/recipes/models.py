@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.core import validators
 from django.db import models
+from django.db.models import Prefetch
+from django.utils import timezone
 
 from .validators import hex_validator
 
@@ -26,6 +28,10 @@ class ShoppingCart(models.Model):
         related_name='shopping_carts',
         verbose_name='ID рецепта'
     )
+    created = models.DateTimeField(
+        verbose_name='дата добавления',
+        default=timezone.now
+    )
 
     class Meta:
         verbose_name = 'список покупок'
@@ -56,6 +62,10 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='ID рецепта'
     )
+    created = models.DateTimeField(
+        verbose_name='дата добавления',
+        default=timezone.now
+    )
 
     class Meta:
         verbose_name = 'избранное'
@@ -67,6 +77,30 @@ class Favorite(models.Model):
         ]
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с загрузкой всех данных, нужных API."""
+
+    def for_api(self, user):
+        """Возвращает рецепты вместе с автором (с флагом is_subscribed для
+        пользователя user), тегами и ингредиентами. Количество запросов не
+        зависит от количества рецептов. Флаги is_favorited и
+        is_in_shopping_cart берутся из recipes.cache.
+        """
+        return self.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            ),
+            'tags',
+            Prefetch(
+                'amountingredientforrecipes',
+                queryset=AmountIngredientForRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Модель 'Рецепты' пользователя.
 
@@ -97,6 +131,11 @@ class Recipe(models.Model):
         verbose_name='картинка рецепта',
         upload_to='recipes/images/'
     )
+    image_variants = models.JSONField(
+        verbose_name='уменьшенные копии картинки',
+        default=dict,
+        editable=False
+    )
     text = models.TextField(
         verbose_name='текст рецепта'
     )
@@ -106,15 +145,65 @@ class Recipe(models.Model):
                 1, message='Минимальное время приготовления 1 минута'),),
         verbose_name='время приготовления'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='кол-во добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        verbose_name='кол-во добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+    popularity = models.FloatField(
+        verbose_name='рейтинг популярности',
+        default=0,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='дата изменения',
+        default=timezone.now,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['-popularity', 'id'], name='recipe_popularity_idx')
+        ]
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.updated_at = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+
+
+class PopularityEpoch(models.Model):
+    """Точка отсчета рейтинга популярности (см. recipes.popularity).
+    Текущая точка отсчета - последняя запись.
+    """
+    started_at = models.DateTimeField(
+        verbose_name='начало отсчета'
+    )
+
+    class Meta:
+        verbose_name = 'точка отсчета рейтинга'
+        verbose_name_plural = 'точки отсчета рейтинга'
+        ordering = ['id']
+
+    def __str__(self) -> str:
+        return str(self.started_at)
+
 
 class Ingredient(models.Model):
     """Модель 'Ингредиенты' для рецепта.
@@ -0,0 +1,139 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from .models import Favorite, PopularityEpoch, Recipe, ShoppingCart
+
+# Рейтинг считается методом forward decay: вклад действия не убывает со
+# временем, а растет от точки отсчета как 2 ** (возраст / период
+# полураспада), поэтому старые оценки не нужно пересчитывать - порядок
+# рецептов по сумме совпадает с порядком по затухающему во времени рейтингу.
+# Чтобы вклады помещались во float (показатель степени до ~1023), точка
+# отсчета хранится в PopularityEpoch и сдвигается функцией rebase():
+# команда refresh_popularity делает это, когда показатель превышает
+# REBASE_EXPONENT, а event_score() - в крайнем случае, при MAX_EXPONENT.
+
+CHUNK_SIZE = 1000
+REBASE_EXPONENT = 256
+MAX_EXPONENT = 512
+
+
+def get_popularity_settings():
+    """Возвращает настройки рейтинга популярности с подставленными
+    значениями по умолчанию.
+
+    Settings:
+        HALF_LIFE_DAYS - за сколько дней вклад действия уменьшается вдвое.
+        FAVORITE_WEIGHT - вес добавления рецепта в избранное.
+        SHOPPING_CART_WEIGHT - вес добавления рецепта в список покупок.
+        EPOCH - начальная точка отсчета рейтинга, пока точка отсчета ни
+        разу не сдвигалась.
+    """
+    return {
+        'HALF_LIFE_DAYS': 7,
+        'FAVORITE_WEIGHT': 2.0,
+        'SHOPPING_CART_WEIGHT': 1.0,
+        'EPOCH': datetime(2022, 1, 1, tzinfo=timezone.utc),
+        **getattr(settings, 'POPULARITY', {}),
+    }
+
+
+def get_epoch():
+    """Возвращает текущую точку отсчета рейтинга."""
+    epoch = PopularityEpoch.objects.order_by('-id').values_list(
+        'started_at', flat=True
+    ).first()
+    return epoch or get_popularity_settings()['EPOCH']
+
+
+def _exponent(created, epoch, popularity_settings):
+    age = (created - epoch).total_seconds()
+    half_life = popularity_settings['HALF_LIFE_DAYS'] * 24 * 60 * 60
+    return age / half_life
+
+
+def _score(weight, created, epoch, popularity_settings):
+    return weight * 2 ** _exponent(created, epoch, popularity_settings)
+
+
+def needs_rebase(exponent_limit=REBASE_EXPONENT):
+    """Проверяет, пора ли сдвигать точку отсчета рейтинга."""
+    return _exponent(
+        django_timezone.now(), get_epoch(), get_popularity_settings()
+    ) > exponent_limit
+
+
+def rebase():
+    """Сдвигает точку отсчета рейтинга на текущий момент и пересчитывает
+    рейтинг всех рецептов относительно нее.
+
+    Returns:
+        int: количество пересчитанных рецептов.
+    """
+    with transaction.atomic():
+        PopularityEpoch.objects.create(started_at=django_timezone.now())
+        return refresh()
+
+
+def event_score(event):
+    """Возвращает вклад объекта Favorite или ShoppingCart в рейтинг
+    популярности рецепта.
+    """
+    popularity_settings = get_popularity_settings()
+    weight = popularity_settings[
+        'FAVORITE_WEIGHT' if isinstance(event, Favorite)
+        else 'SHOPPING_CART_WEIGHT'
+    ]
+    epoch = get_epoch()
+    if _exponent(event.created, epoch, popularity_settings) > MAX_EXPONENT:
+        rebase()
+        epoch = get_epoch()
+    return _score(weight, event.created, epoch, popularity_settings)
+
+
+def refresh(since=None):
+    """Пересчитывает рейтинг популярности рецептов по избранному и спискам
+    покупок.
+
+    Params:
+        since: пересчитать только рецепты, которые добавляли в избранное или
+        список покупок после этого момента. None - пересчитать все рецепты.
+
+    Returns:
+        int: количество пересчитанных рецептов.
+    """
+    popularity_settings = get_popularity_settings()
+    epoch = get_epoch()
+    sources = (
+        (Favorite, popularity_settings['FAVORITE_WEIGHT']),
+        (ShoppingCart, popularity_settings['SHOPPING_CART_WEIGHT']),
+    )
+    if since is None:
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    else:
+        recipe_ids = set()
+        for model, _ in sources:
+            recipe_ids.update(model.objects.filter(
+                created__gte=since
+            ).values_list('recipe_id', flat=True))
+        recipe_ids = sorted(recipe_ids)
+
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        chunk = recipe_ids[start:start + CHUNK_SIZE]
+        scores = defaultdict(float)
+        for model, weight in sources:
+            events = model.objects.filter(recipe_id__in=chunk).values_list(
+                'recipe_id', 'created'
+            )
+            for recipe_id, created in events.iterator():
+                scores[recipe_id] += _score(
+                    weight, created, epoch, popularity_settings
+                )
+        Recipe.objects.bulk_update(
+            [Recipe(id=id, popularity=scores[id]) for id in chunk],
+            ('popularity',)
+        )
+    return len(recipe_ids)
@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .cache import (favorite_ids_cache, ingredient_cache,
+                    recipe_response_cache, shopping_cart_ids_cache, tag_cache)
+from .counters import increment
+from .images import schedule_variants, variants_outdated
+from .models import (AmountIngredientForRecipe, Favorite, Ingredient, Recipe,
+                     ShoppingCart, Tag)
+from .popularity import event_score
+
+User = get_user_model()
+Subscription = User.subscribe.through
+
+# Счетчики рецепта, которые меняются при добавлении его в избранное или
+# список покупок.
+EVENT_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_carts_count',
+}
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(sender, **kwargs):
+    """Сбрасывает кэш тегов при любом изменении тега."""
+    tag_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_cache(sender, **kwargs):
+    """Сбрасывает кэш ингредиентов при любом изменении ингредиента."""
+    ingredient_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=AmountIngredientForRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_responses(sender, **kwargs):
+    """Сбрасывает кэш ответов с рецептами после коммита транзакции, чтобы
+    параллельный запрос не успел закэшировать еще не сохраненные данные.
+    """
+    transaction.on_commit(recipe_response_cache.invalidate)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_recipe_responses_on_user_change(sender, created, update_fields,
+                                               **kwargs):
+    """Ответы с рецептами содержат данные автора. Новые пользователи и
+    обновление даты входа на них не влияют.
+    """
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    transaction.on_commit(recipe_response_cache.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def invalidate_favorite_ids_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш id избранных рецептов пользователя."""
+    transaction.on_commit(
+        lambda: favorite_ids_cache.invalidate(instance.user_id)
+    )
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def invalidate_shopping_cart_ids_cache(sender, instance, **kwargs):
+    """Сбрасывает кэш id рецептов из списка покупок пользователя."""
+    transaction.on_commit(
+        lambda: shopping_cart_ids_cache.invalidate(instance.user_id)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, raw, **kwargs):
+    """Строит уменьшенные копии картинки рецепта в фоне, если картинка
+    новая. При загрузке фикстур (raw) копии строит команда
+    build_image_variants.
+    """
+    if not raw and variants_outdated(instance):
+        transaction.on_commit(lambda: schedule_variants(instance.id))
+
+
+# Денормализованные счетчики (recipes.counters) меняются сигналами, поэтому
+# их учитывает любой способ записи: API, админка, ORM. bulk_create и
+# загрузка фикстур (raw) сигналов не отправляют, после них счетчики
+# пересчитывает reconcile().
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added_event(sender, instance, created, raw, **kwargs):
+    """Учитывает добавление рецепта в избранное или список покупок в
+    счетчике и рейтинге популярности рецепта.
+    """
+    if created and not raw:
+        increment(
+            Recipe(pk=instance.recipe_id),
+            popularity=event_score(instance), **{EVENT_COUNTERS[sender]: 1}
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_removed_event(sender, instance, **kwargs):
+    """Вычитает удаленное из избранного или списка покупок действие из
+    счетчика и рейтинга популярности рецепта.
+    """
+    increment(
+        Recipe(pk=instance.recipe_id),
+        popularity=-event_score(instance), **{EVENT_COUNTERS[sender]: -1}
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def count_added_recipe(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        increment(User(pk=instance.author_id), recipes_count=1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_removed_recipe(sender, instance, **kwargs):
+    increment(User(pk=instance.author_id), recipes_count=-1)
+
+
+@receiver(m2m_changed, sender=Subscription)
+def count_subscriptions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Учитывает подписки, измененные через менеджер user.subscribe
+    (add, remove, clear, set - например, в админке).
+
+    Строки промежуточной таблицы, созданные и удаленные напрямую, сигналов
+    post_save и post_delete не отправляют, поэтому API меняет счетчик
+    подписчиков сам.
+    """
+    if action == 'pre_remove':
+        # remove() передает все переданные id, в том числе тех, на кого
+        # подписки нет. Оставляем только существующие подписки, чтобы
+        # post_remove вычел ровно удаленные.
+        if reverse:
+            existing = Subscription.objects.filter(
+                to_user=instance, from_user__in=pk_set
+            ).values_list('from_user_id', flat=True)
+        else:
+            existing = Subscription.objects.filter(
+                from_user=instance, to_user__in=pk_set
+            ).values_list('to_user_id', flat=True)
+        pk_set.intersection_update(existing)
+        return
+    if action == 'pre_clear':
+        if reverse:
+            User.objects.filter(pk=instance.pk).update(subscribers_count=0)
+        else:
+            User.objects.filter(subscribers=instance).update(
+                subscribers_count=F('subscribers_count') - 1
+            )
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        increment(instance, subscribers_count=delta * len(pk_set))
+    else:
+        User.objects.filter(pk__in=pk_set).update(
+            subscribers_count=F('subscribers_count') + delta
+        )
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def count_deleted_subscriber(sender, instance, **kwargs):
+    """Подписки удаляемого пользователя удаляются каскадно без сигналов,
+    поэтому счетчики авторов, на которых он подписан, уменьшаются здесь.
+    """
+    User.objects.filter(subscribers=instance).update(
+        subscribers_count=F('subscribers_count') - 1
+    )
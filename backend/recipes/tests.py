@@ -0,0 +1,134 @@
+from contextlib import redirect_stderr
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+
+from .cache import ReferenceCache, UserRecipesCache
+from .models import Favorite, Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Планы запросов PostgreSQL')
+class IndexUsageTest(TestCase):
+    """Проверяет по EXPLAIN, что запросы API используют индексы.
+
+    Таблицы в тестах маленькие, поэтому последовательное сканирование
+    выключается - если подходящего индекса нет, план его все равно покажет.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def index_exists(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s',
+                           (name,))
+            return cursor.fetchone() is not None
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_ingredient_search_uses_trgm_index(self):
+        index_name = 'recipes_ingredient_name_upper_trgm'
+        if not self.index_exists(index_name):
+            self.skipTest('Расширение pg_trgm недоступно')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.assertUsesIndex(
+            Ingredient.objects.filter(name__icontains='оль'), index_name
+        )
+        self.assertUsesIndex(
+            Ingredient.objects.filter(name__istartswith='сол'), index_name
+        )
+
+    def test_subscribers_lookup_uses_to_user_index(self):
+        self.assertUsesIndex(
+            User.subscribe.through.objects.filter(to_user_id=1),
+            'users_user_subscribe_to_from_idx'
+        )
+
+
+class ReferenceCacheTest(TestCase):
+    """Сброс кэша справочника виден другим процессам, а без общего кэша
+    справочник перечитывается по TIMEOUT.
+    """
+    fields = ('id', 'name', 'color', 'slug')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def create_tags(self, *slugs):
+        # bulk_create не отправляет сигналы, сбрасывающие кэш.
+        Tag.objects.bulk_create(
+            Tag(name=slug, color=f'#{index:06d}', slug=slug)
+            for index, slug in enumerate(slugs, len(Tag.objects.all()))
+        )
+
+    def test_invalidate_reaches_other_processes(self):
+        server = ReferenceCache(Tag, self.fields)
+        command = ReferenceCache(Tag, self.fields)
+        self.create_tags('breakfast')
+        self.assertEqual(len(server.all()), 1)
+        self.create_tags('lunch')
+        self.assertEqual(len(server.all()), 1)
+        command.invalidate()
+        self.assertEqual(len(server.all()), 2)
+
+    @override_settings(REFERENCE_CACHE={'CACHE_ALIAS': None, 'TIMEOUT': 0})
+    def test_process_cache_expires(self):
+        cache = ReferenceCache(Tag, self.fields)
+        self.create_tags('breakfast')
+        self.assertEqual(len(cache.all()), 1)
+        self.create_tags('lunch')
+        self.assertEqual(len(cache.all()), 2)
+
+
+class ImportCsvTest(TestCase):
+    """После загрузки csv счетчики совпадают с данными."""
+
+    def test_counters_are_filled(self):
+        with redirect_stderr(StringIO()):
+            call_command('import_csv', stdout=StringIO())
+        self.assertTrue(Recipe.objects.exists())
+        users = User.objects.annotate(actual=Count('recipes'))
+        for user in users:
+            self.assertEqual(user.recipes_count, user.actual, user.username)
+
+
+class UserRecipesCacheTest(TestCase):
+    """Сброс множества во время его загрузки из базы не теряется."""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_invalidate_during_fetch(self):
+        user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='password'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='Описание', cooking_time=10,
+            image=''
+        )
+        cache = UserRecipesCache(Favorite)
+        fetch = cache._fetch
+
+        def fetch_before_concurrent_write(user):
+            ids = fetch(user)
+            Favorite.objects.create(user=user, recipe=recipe)
+            cache.invalidate(user.id)
+            return ids
+
+        with mock.patch.object(cache, '_fetch', fetch_before_concurrent_write):
+            self.assertEqual(cache.get(user), frozenset())
+        user = User.objects.get(id=user.id)
+        self.assertEqual(cache.get(user), frozenset({recipe.id}))
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_managers'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX users_user_subscribe_to_from_idx '
+            'ON users_user_subscribe (to_user_id, from_user_id)',
+            'DROP INDEX users_user_subscribe_to_from_idx',
+        ),
+    ]
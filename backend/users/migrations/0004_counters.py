@@ -0,0 +1,43 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'subscribers_count', 'users.User_subscribe', 'to_user'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, source_name, source_field in COUNTERS:
+        model = apps.get_model(*model_name.split('.'))
+        source = apps.get_model(*source_name.split('.'))
+        model.objects.update(**{field: Coalesce(Subquery(
+            source.objects.filter(**{source_field: OuterRef('pk')})
+            .order_by().values(source_field)
+            .annotate(count=Count('pk')).values('count')
+        ), Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_subscribe_to_user_from_user_index'),
+        ('recipes', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='кол-во рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='кол-во подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
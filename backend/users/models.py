@@ -1,5 +1,27 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
+
+
+class UserQuerySet(models.QuerySet):
+    """QuerySet пользователей с аннотациями для API."""
+
+    def with_is_subscribed(self, user):
+        """Аннотирует пользователей флагом is_subscribed - подписан ли на них
+        пользователь user. Для гостей флаг всегда False.
+        """
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=Value(False))
+        return self.annotate(is_subscribed=Exists(
+            User.subscribe.through.objects.filter(
+                from_user=user, to_user=OuterRef('pk')
+            )
+        ))
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
@@ -30,6 +52,18 @@ class User(AbstractUser):
         related_name='subscribers',
         symmetrical=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='кол-во рецептов',
+        default=0,
+        editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='кол-во подписчиков',
+        default=0,
+        editable=False
+    )
+
+    objects = UserManager()
 
     class Meta:
         verbose_name = 'пользователь'